@@ -0,0 +1,277 @@
+"""Benchmarks scanning, building and mixing on synthetic source trees.
+
+    python bench/benchmark.py --sizes 1000,10000,100000 --output before.json
+    python bench/benchmark.py --compare before.json --output after.json
+
+The trees are generated once under --root and reused by later runs. Each
+benchmark is timed --repeat times; peak memory is measured in a separate
+run with tracemalloc, so that tracing doesn't inflate the times.
+"""
+import os, sys, json, time, random, asyncio, logging, argparse, datetime, platform, tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import defaults, utils, version
+from mixing import ZipEqually
+from playlist import Playlist
+from pipeline import RebuildPipeline
+from outputs import Output
+from scancache import ScanCache
+
+ALLOWED_EXTENSIONS = tuple(list(defaults.MEDIA_EXTENSIONS) + list(defaults.PLAYLIST_EXTENSIONS))
+
+# Extensions of the generated files, including ones that are not media
+EXTENSIONS = ('.mp4', '.mp4', '.mkv', '.MOV', '.jpg', '.png', '.m3u', '.txt', '.srt')
+
+LAYOUTS = ('flat', 'nested')
+NESTED_FANOUT = 10
+NESTED_FILES_PER_DIR = 100
+
+# How many small sources are mixed with the big one
+SMALL_SOURCES = 50
+
+
+def file_names(count, seed):
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    
+    for i in range(count):
+        ext = rng.choice(EXTENSIONS)
+        roll = rng.random()
+        
+        if roll < 0.05:
+            # Matches FILENAME_WITH_A_DATE_PATTERN and is played today
+            prefix = today.strftime('%d-%m-%Y-')
+        elif roll < 0.1:
+            # Matches the pattern but is skipped
+            prefix = (today - datetime.timedelta(days=rng.randint(1, 365))).strftime('%d-%m-%Y-')
+        else:
+            prefix = ''
+        
+        yield '%sclip_%07d%s' % (prefix, i, ext)
+
+
+def nested_dirs(path, count):
+    # Spreads count files over a tree NESTED_FANOUT directories wide
+    dirs = max(1, count // NESTED_FILES_PER_DIR)
+    depth = 1
+    
+    while NESTED_FANOUT ** depth < dirs:
+        depth += 1
+    
+    for i in range(dirs):
+        parts, n = [], i
+        
+        for level in range(depth):
+            n, part = divmod(n, NESTED_FANOUT)
+            parts.append('d%02d' % part)
+        
+        yield os.path.join(path, *parts)
+
+
+def generate_tree(path, count, layout):
+    marker = os.path.join(path, '.complete')
+    
+    if os.path.isfile(marker):
+        return path
+    
+    if layout == 'flat':
+        dirs = [path]
+    else:
+        dirs = list(nested_dirs(path, count))
+    
+    for directory in dirs:
+        os.makedirs(directory, exist_ok=True)
+    
+    for i, name in enumerate(file_names(count, seed=count)):
+        open(os.path.join(dirs[i % len(dirs)], name), 'wb').close()
+    
+    open(marker, 'wb').close()
+    
+    return path
+
+
+def generate_small_sources(root):
+    paths = []
+    
+    for i in range(SMALL_SOURCES):
+        path = os.path.join(root, 'small', 's%02d' % i)
+        os.makedirs(path, exist_ok=True)
+        open(os.path.join(path, 'spot_%02d.mp4' % i), 'wb').close()
+        paths.append(path)
+    
+    return paths
+
+
+def make_playlist(name, paths, recursive, mixing='zip_equally', scan_cache=None):
+    playlist = Playlist(
+        name=name, allowed_extensions=ALLOWED_EXTENSIONS,
+        filename_with_a_date_pattern=defaults.FILENAME_WITH_A_DATE_PATTERN,
+        source_mixing_function=mixing, recursive=recursive, scan_cache=scan_cache
+    )
+    
+    for path in paths:
+        playlist.add_source({'path': path})
+    
+    return playlist
+
+
+def make_output(name, sources, recursive, scan_cache=None):
+    return Output(name, sources, {
+        'allowed_extensions': ALLOWED_EXTENSIONS,
+        'filename_with_a_date_pattern': defaults.FILENAME_WITH_A_DATE_PATTERN,
+        'recursive': recursive,
+        'scan_cache': scan_cache
+    })
+
+
+def measure(func, repeat):
+    times = []
+    
+    for i in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    
+    tracemalloc.start()
+    
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    
+    times.sort()
+    
+    return {
+        'min': times[0],
+        'median': times[len(times) // 2],
+        'max': times[-1],
+        'peak_memory': peak
+    }
+
+
+def get_benchmarks(tree, small, recursive):
+    big = make_playlist('BIG', [tree], recursive)
+    source = big.prepare_source({'path': tree})
+    
+    def rebuild(scan_cache=None, outputs=1):
+        sources = [{'path': path} for path in [tree] + small]
+        sources += [{'path': path, 'play_every_minutes': 15} for path in small[:2]]
+        pipeline = RebuildPipeline([
+            make_output('screen%i' % i if outputs > 1 else '', sources, recursive, scan_cache)
+            for i in range(outputs)
+        ], scan_cache=scan_cache)
+        
+        def run():
+            asyncio.get_event_loop().run_until_complete(pipeline.rebuild())
+        
+        return run
+    
+    cached = ScanCache()
+    rebuild(cached)()  # fill the cache
+    
+    benchmarks = [
+        ('list_files_with_extensions', lambda: list(utils.list_files_with_extensions(
+            tree, ALLOWED_EXTENSIONS, recursive=recursive
+        ))),
+        ('get_source_contents', lambda: list(big.get_source_contents(source)))
+    ]
+    
+    for mixing in ('zip_equally', 'proportional', 'chain'):
+        playlist = make_playlist('PRIMARY', [tree] + small, recursive, mixing)
+        benchmarks.append(('build[%s]' % mixing, playlist.build))
+    
+    paths = list(utils.list_files_with_extensions(tree, ALLOWED_EXTENSIONS, recursive=recursive))
+    lists = [paths] + [[path] for path in small]
+    
+    benchmarks += [
+        ('ZipEqually[iterate]', lambda: list(ZipEqually(lists))),
+        ('rebuild', rebuild()),
+        ('rebuild[scan_cache]', rebuild(cached)),
+        ('rebuild[4 outputs]', rebuild(outputs=4))
+    ]
+    
+    return benchmarks
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    
+    previous = {(r['name'], r['layout'], r['files']): r for r in baseline['results']}
+    
+    print('\nCompared with %s (v%s):' % (baseline_path, baseline.get('version')))
+    
+    for result in results:
+        before = previous.get((result['name'], result['layout'], result['files']))
+        
+        if before is None:
+            continue
+        
+        print('  %-28s %-6s %8i  time %6.2fx  memory %6.2fx' % (
+            result['name'], result['layout'], result['files'],
+            result['median'] / max(before['median'], 1e-9),
+            result['peak_memory'] / max(before['peak_memory'], 1)
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='VLC Scheduler benchmarks.')
+    parser.add_argument(
+        '--sizes', default='1000,10000,100000',
+        help='comma-separated numbers of files, up to 1000000'
+    )
+    parser.add_argument('--layouts', default=','.join(LAYOUTS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--root', default=os.path.join(os.path.abspath('.'), 'bench-trees'))
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--compare', metavar='JSON', help='results of an earlier run')
+    parser.add_argument('--filter', default='', help='run only benchmarks containing this')
+    args = parser.parse_args()
+    
+    # Every rebuild warns that the SPECIAL playlists are empty, keep the table readable
+    logging.disable(logging.CRITICAL)
+    
+    small = generate_small_sources(args.root)
+    results = []
+    
+    for layout in args.layouts.split(','):
+        if layout not in LAYOUTS:
+            parser.error('Unknown layout: %s' % layout)
+        
+        for size in (int(s) for s in args.sizes.split(',')):
+            print('Generating %s tree of %i files...' % (layout, size), file=sys.stderr)
+            tree = generate_tree(os.path.join(args.root, '%s-%i' % (layout, size)), size, layout)
+            
+            for name, func in get_benchmarks(tree, small, layout == 'nested'):
+                if args.filter not in name:
+                    continue
+                
+                result = dict(name=name, layout=layout, files=size, **measure(func, args.repeat))
+                results.append(result)
+                
+                print('  %-28s %-6s %8i  %9.4f s  %9.1f MB' % (
+                    name, layout, size, result['median'], result['peak_memory'] / 1e6
+                ))
+    
+    report = {
+        'version': version.VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'repeat': args.repeat,
+        'results': results
+    }
+    
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    
+    print('Results have been saved to %s.' % args.output, file=sys.stderr)
+    
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
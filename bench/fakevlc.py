@@ -0,0 +1,218 @@
+"""A stand-in for VLC's HTTP interface, for tests and simulations.
+
+Implements the parts of requests/status.xml, status.json and playlist.json
+that VLC Scheduler uses. Media lengths come from the ``lengths`` dict, and
+every response can be delayed or made to fail. All times are taken from
+the event loop, so under simulate.py they are virtual.
+
+    python bench/fakevlc.py --port 8080 --latency 0.05 --failure-rate 0.01
+"""
+import json, random, asyncio, logging, argparse, collections
+
+from urllib.parse import unquote
+
+STATUS_XML = '<?xml version="1.0" encoding="utf-8" standalone="yes" ?>\n<root>%s</root>'
+
+
+class FakeVLC:
+    """Keeps a VLC-like playlist and records what was played and when.
+    
+    ``latency`` (+ up to ``jitter``) seconds are added to every response.
+    With probability ``failure_rate`` a request gets a 500 response, with
+    ``stall_rate`` it gets no response at all. VLC runs with --repeat, so
+    the current item loops until it's replaced. Images and unknown files
+    report a length of 0; real lengths are only reported ``length_delay``
+    seconds after an item starts, like VLC does while it opens the file.
+    """
+    
+    def __init__(self, lengths=None, default_length=0, latency=0, jitter=0,
+                 failure_rate=0, stall_rate=0, length_delay=0.1, seed=None):
+        self.lengths = lengths or {}
+        self.default_length = default_length
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.stall_rate = stall_rate
+        self.length_delay = length_delay
+        self.random = random.Random(seed)
+        self.server = None
+        self.entries = []
+        self.current = None
+        self.started = None
+        self._next_id = 3  # VLC's own nodes take the first ids
+        self.plays = []  # (time, uri, length, command)
+        self.requests = []  # (time, command)
+        self.failures = collections.Counter()
+    
+    def now(self):
+        return asyncio.get_event_loop().time()
+    
+    def get_length(self, uri):
+        return self.lengths.get(uri, self.default_length)
+    
+    async def start(self, host='127.0.0.1', port=8080):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+    
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+    
+    # Playlist
+    
+    def _add(self, uri):
+        self._next_id += 1
+        entry = {
+            'type': 'leaf', 'id': str(self._next_id), 'uri': uri,
+            'name': uri.rpartition('/')[2], 'duration': -1
+        }
+        self.entries.append(entry)
+        return entry
+    
+    def _play(self, entry, command):
+        self.current = entry
+        self.started = self.now()
+        
+        if entry['duration'] < 0:
+            entry['duration'] = int(self.get_length(entry['uri'])) or -1
+        
+        self.plays.append((self.started, entry['uri'], self.get_length(entry['uri']), command))
+    
+    def command(self, command, params):
+        if command == 'in_play':
+            self._play(self._add(params['input']), command)
+        elif command == 'in_enqueue':
+            self._add(params['input'])
+        elif command == 'pl_next' and self.entries:
+            ids = [e['id'] for e in self.entries]
+            index = ids.index(self.current['id']) + 1 if self.current in self.entries else 0
+            self._play(self.entries[index % len(self.entries)], command)
+        elif command == 'pl_play' and self.entries:
+            found = [e for e in self.entries if e['id'] == params.get('id')]
+            self._play(found[0] if found else self.entries[0], command)
+        elif command == 'pl_delete':
+            self.entries = [e for e in self.entries if e['id'] != params.get('id')]
+        elif command in ('pl_empty', 'pl_stop'):
+            if command == 'pl_empty':
+                self.entries = []
+            
+            if self.current is not None:
+                self.plays.append((self.now(), None, 0, command))
+            
+            self.current = None
+    
+    def status(self):
+        if self.current is None:
+            return {'state': 'stopped', 'length': 0, 'time': 0, 'repeat': True}
+        
+        elapsed = self.now() - self.started
+        length = self.get_length(self.current['uri'])
+        
+        if elapsed < self.length_delay:
+            length = 0
+        
+        return {
+            'state': 'playing',
+            'length': int(length),
+            'time': int(elapsed % length) if length else int(elapsed),
+            'currentplid': int(self.current['id']),
+            'information': {'category': {'meta': {'filename': self.current['name']}}},
+            'repeat': True
+        }
+    
+    def playlist(self):
+        return {'type': 'node', 'id': '1', 'children': [
+            {'type': 'node', 'id': '2', 'name': 'Playlist', 'children': self.entries}
+        ]}
+    
+    # HTTP
+    
+    async def handle(self, reader, writer):
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        
+        target = head.decode('iso-8859-1').split(' ', 2)[1]
+        path, _, query = target.partition('?')
+        # VLC Scheduler doesn't urlencode the parameters, except for =
+        params = dict(
+            (k, unquote(v)) for k, _, v in (p.partition('=') for p in query.split('&') if p)
+        )
+        command = params.pop('command', None)
+        self.requests.append((self.now(), command or path))
+        
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        
+        if self.random.random() < self.stall_rate:
+            self.failures['stall'] += 1
+            delay = 3600
+        
+        if delay:
+            await asyncio.sleep(delay)
+        
+        if self.random.random() < self.failure_rate:
+            self.failures['error'] += 1
+            status, content_type, body = '500 Internal Server Error', 'text/plain', 'Error'
+        else:
+            status = '200 OK'
+            content_type, body = self.respond(path, command, params)
+        
+        try:
+            writer.write((
+                'HTTP/1.0 %s\r\nContent-Type: %s\r\nContent-Length: %i\r\n\r\n' % (
+                    status, content_type, len(body.encode('utf-8'))
+                )
+            ).encode('iso-8859-1') + body.encode('utf-8'))
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    
+    def respond(self, path, command, params):
+        if command:
+            self.command(command, params)
+        
+        if path.endswith('/status.json'):
+            return 'application/json', json.dumps(self.status())
+        elif path.endswith('/playlist.json'):
+            return 'application/json', json.dumps(self.playlist())
+        elif path.endswith('/status.xml'):
+            return 'text/xml', STATUS_XML % ''.join(
+                '<%s>%s</%s>' % (k, v, k) for k, v in self.status().items()
+            )
+        else:
+            return 'text/html', '<html><title>VLC media player - Web Interface</title>VideoLAN</html>'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake VLC HTTP interface.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--default-length', type=float, default=30)
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--jitter', type=float, default=0)
+    parser.add_argument('--failure-rate', type=float, default=0)
+    parser.add_argument('--stall-rate', type=float, default=0)
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    vlc = FakeVLC(
+        default_length=args.default_length, latency=args.latency, jitter=args.jitter,
+        failure_rate=args.failure_rate, stall_rate=args.stall_rate
+    )
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(vlc.start(args.host, args.port))
+    logging.info('Fake VLC is listening on %s:%i.' % (args.host, args.port))
+    
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,399 @@
+"""Replays a day of playout against fake VLC on a virtual clock.
+
+    python bench/simulate.py --hours 24 --latency 0.05 --jitter 0.1
+    python bench/simulate.py --config vlcscheduler.yaml --gapless --output day.json
+
+VLC Scheduler runs unmodified, but the event loop's clock only moves
+forward when everything is waiting for a timer, so a day takes seconds.
+Without --config a scenario with a main source, a morning and an evening
+source (playing_time) and ads (play_every_minutes) is generated. The
+report shows how late each item started compared to when the previous
+one should have ended, the dead air between items, the drift from the
+ideal timeline, and the HTTP requests made per item.
+"""
+import os, sys, json, time, socket, random, asyncio, logging, argparse, datetime, selectors, tempfile, collections
+
+import yaml
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+from fakevlc import FakeVLC
+
+
+class VirtualSelector:
+    """Wraps a selector so that waiting for a timer jumps the loop's clock instead."""
+    
+    def __init__(self, selector):
+        self._selector = selector
+        self.loop = None
+    
+    def __getattr__(self, name):
+        return getattr(self._selector, name)
+    
+    def select(self, timeout=None):
+        events = self._selector.select(0)
+        
+        if events or timeout == 0:
+            return events
+        
+        if self.loop.busy:
+            # Threads are working: virtual time stands still until they're done
+            return self._selector.select(0.1)
+        
+        # Give loopback connections a moment to deliver what's in flight
+        events = self._selector.select(0.0005)
+        
+        if events or timeout is None:
+            return events or self._selector.select(timeout)
+        
+        self.loop.advance(timeout)
+        return []
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    def __init__(self):
+        self._virtual_time = 0.0
+        self.busy = 0
+        selector = VirtualSelector(selectors.DefaultSelector())
+        super().__init__(selector)
+        selector.loop = self
+    
+    def time(self):
+        return self._virtual_time
+    
+    def advance(self, seconds):
+        self._virtual_time += seconds
+    
+    def run_in_executor(self, executor, func, *args):
+        future = super().run_in_executor(executor, func, *args)
+        self.busy += 1
+        
+        def done(future):
+            self.busy -= 1
+        
+        future.add_done_callback(done)
+        return future
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def generate_scenario(root, seed):
+    """Creates media files and returns the sources and their lengths."""
+    rng = random.Random(seed)
+    lengths = {}
+    sources = [
+        {'path': 'main'},
+        {'path': 'morning', 'playing_time': '06:00-12:00', 'item_play_duration': 45},
+        {'path': 'evening', 'playing_time': '18:00-23:30', 'shuffle': True},
+        {'path': 'ads', 'play_every_minutes': 30}
+    ]
+    files = {
+        'main': [('main_%02d.mp4' % i, rng.randint(20, 300)) for i in range(20)],
+        'morning': [('morning_%02d.mp4' % i, rng.randint(30, 600)) for i in range(10)],
+        'evening': [('evening_%02d.jpg' % i, 0) for i in range(8)],
+        'ads': [('ad_%02d.mp4' % i, 15) for i in range(3)]
+    }
+    
+    for source in sources:
+        source['path'] = os.path.join(root, source['path'])
+        os.makedirs(source['path'])
+        
+        for name, length in files[os.path.basename(source['path'])]:
+            path = os.path.join(source['path'], name)
+            open(path, 'wb').close()
+            lengths[path] = length
+    
+    return sources, lengths
+
+
+def write_config(path, user_config, sources, port, gapless):
+    config = dict(user_config)
+    config.update({
+        'sources': sources,
+        'vlc': {
+            'path': sys.executable, 'host': '127.0.0.1', 'port': port,
+            'password': 'simulate', 'timeout': 5
+        },
+        'gapless_playback': gapless,
+        'duration_cache': '',
+        'scan_cache': '',
+        'shuffle_state': '',
+        'snapshot': '',
+        'ping_urls': []
+    })
+    config.setdefault('image_play_duration', 20)
+    
+    with open(path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(config, f)
+
+
+def summarize(values):
+    if not values:
+        return {'count': 0}
+    
+    values = sorted(values)
+    
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values),
+        'p50': values[len(values) // 2],
+        'p95': values[min(int(len(values) * 0.95), len(values) - 1)],
+        'max': values[-1]
+    }
+
+
+def analyse(vlc, sources, start, image_play_duration, window_tolerance=5):
+    import utils
+    
+    prepared = []
+    
+    for source in sources:
+        window = None
+        
+        if source.get('playing_time'):
+            window = tuple(
+                datetime.datetime.strptime(t, '%H:%M').time()
+                for t in utils.parse_time_interval(source['playing_time'])
+            )
+        
+        prepared.append((os.path.normpath(source['path']), source, window))
+    
+    def find_source(uri):
+        candidates = [p for p in prepared if uri == p[0] or uri.startswith(p[0] + os.sep)]
+        return max(candidates, key=lambda p: len(p[0])) if candidates else (None, {}, None)
+    
+    def intended(source, length):
+        play_duration = int(source.get('item_play_duration', 0))
+        
+        if play_duration > 0:
+            return play_duration
+        
+        length = length if length > 0 else image_play_duration
+        
+        return min(length, -play_duration) if play_duration < 0 else length
+    
+    latencies, gaps, drifts, stopped = [], [], [], 0
+    interrupted, window_violations, max_overshoot = 0, 0, 0
+    ads = collections.defaultdict(list)
+    items = 0
+    ideal = None
+    
+    for i, (t, uri, length, command) in enumerate(vlc.plays):
+        following = vlc.plays[i + 1] if i + 1 < len(vlc.plays) else None
+        
+        if uri is None:
+            if following:
+                stopped += following[0] - t
+            
+            ideal = None
+            continue
+        
+        items += 1
+        path, source, window = find_source(uri)
+        duration = intended(source, length)
+        
+        if ideal is None:
+            ideal = t
+        
+        drifts.append(t - ideal)
+        ideal += duration
+        
+        if source.get('play_every_minutes'):
+            ads[uri].append(t)
+        
+        if window:
+            wall = datetime.datetime.fromtimestamp(start + t)
+            
+            if not utils.is_time_within_interval(wall.time(), *window):
+                # How long after the end of the window the item started
+                end = datetime.datetime.combine(wall.date(), window[1])
+                overshoot = (wall - end).total_seconds() % 86400
+                max_overshoot = max(max_overshoot, overshoot)
+                
+                if overshoot > window_tolerance:
+                    window_violations += 1
+        
+        if following is None:
+            continue
+        
+        if following[1] is None:
+            interrupted += 1
+            continue
+        
+        latencies.append(following[0] - (t + duration))
+        
+        if length > 0:
+            gaps.append(max(following[0] - t - max(length, duration), 0))
+    
+    commands = collections.Counter(command for t, command in vlc.requests)
+    
+    return {
+        'items': items,
+        'interrupted': interrupted,
+        'transition_latency': summarize(latencies),
+        'gap': summarize(gaps),
+        'dead_air': sum(gaps) + stopped,
+        'drift': summarize([abs(d) for d in drifts]),
+        'requests': len(vlc.requests),
+        'requests_per_item': len(vlc.requests) / items if items else 0,
+        'requests_by_command': dict(commands.most_common()),
+        'failures': dict(vlc.failures),
+        'window_violations': window_violations,
+        'max_window_overshoot': max_overshoot,
+        'ads': {
+            path: {
+                'count': len(times),
+                'mean_interval': (times[-1] - times[0]) / (len(times) - 1) if len(times) > 1 else None
+            } for path, times in ads.items()
+        }
+    }
+
+
+def print_report(report):
+    print('Simulated %(hours)s hour(s) from %(start)s in %(elapsed).1f seconds.' % report)
+    
+    if report['error']:
+        print('VLC Scheduler stopped after %.0f seconds: %s' % (report['stopped_at'], report['error']))
+    
+    print('Items played: %(items)i (%(interrupted)i interrupted by rebuilds)' % report)
+    print('HTTP requests: %(requests)i, %(requests_per_item).2f per item' % report)
+    
+    for command, count in report['requests_by_command'].items():
+        print('    %-20s %i' % (command, count))
+    
+    for name in ('transition_latency', 'gap', 'drift'):
+        stats = report[name]
+        
+        if stats['count']:
+            print('%-20s mean %8.3f s   p50 %8.3f s   p95 %8.3f s   max %8.3f s' % (
+                name.replace('_', ' ').capitalize() + ':',
+                stats['mean'], stats['p50'], stats['p95'], stats['max']
+            ))
+    
+    print('Dead air: %(dead_air).1f seconds' % report)
+    print('Items started outside playing_time: %(window_violations)i '
+          '(max %(max_window_overshoot).1f s late)' % report)
+    
+    for path, ads in sorted(report['ads'].items()):
+        print('Ad %s: played %i times, every %s seconds on average' % (
+            path, ads['count'], '%.0f' % ads['mean_interval'] if ads['mean_interval'] else '-'
+        ))
+    
+    if report['failures']:
+        print('Injected failures: %s' % report['failures'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate VLC Scheduler on a virtual clock.')
+    parser.add_argument('--hours', type=float, default=24)
+    parser.add_argument('--start', help='YYYY-MM-DD HH:MM (default: today 05:00)')
+    parser.add_argument('--config', help='take the sources and settings from this yaml')
+    parser.add_argument('--default-length', type=float, default=60,
+                        help='length of the videos from --config sources')
+    parser.add_argument('--gapless', action='store_true')
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--jitter', type=float, default=0)
+    parser.add_argument('--failure-rate', type=float, default=0)
+    parser.add_argument('--stall-rate', type=float, default=0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='save the report as JSON')
+    parser.add_argument('--verbose', action='store_true', help="show VLC Scheduler's log")
+    args = parser.parse_args()
+    
+    if args.start:
+        start = datetime.datetime.strptime(args.start, '%Y-%m-%d %H:%M')
+    else:
+        start = datetime.datetime.combine(datetime.date.today(), datetime.time(5, 0))
+    
+    root = tempfile.mkdtemp(prefix='vlcscheduler-sim-')
+    user_config = {}
+    
+    if args.config:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            user_config = yaml.safe_load(f) or {}
+        
+        sources, lengths = user_config.pop('sources', []), {}
+    else:
+        sources, lengths = generate_scenario(root, args.seed)
+    
+    config_path = os.path.join(root, 'vlcscheduler.yaml')
+    port = free_port()
+    write_config(config_path, user_config, sources, port, args.gapless)
+    os.environ['VLCSCHEDULER_YAML'] = config_path
+    
+    loop = VirtualClockLoop()
+    asyncio.set_event_loop(loop)
+    
+    import vlcscheduler
+    from config import config, load as load_config
+    
+    # Reads the configuration written above
+    load_config()
+    
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+        vlcscheduler.logger.setLevel(logging.WARNING)
+    
+    vlc = FakeVLC(
+        lengths=lengths, default_length=args.default_length, latency=args.latency,
+        jitter=args.jitter, failure_rate=args.failure_rate, stall_rate=args.stall_rate,
+        seed=args.seed
+    )
+    start_ts = start.timestamp()
+    result = {'error': None, 'stopped_at': None}
+    
+    async def run():
+        await vlc.start('127.0.0.1', port)
+        task = asyncio.ensure_future(
+            vlcscheduler.main_coro(wall_time=lambda: start_ts + loop.time())
+        )
+        done, pending = await asyncio.wait([task], timeout=args.hours * 3600)
+        
+        if task in done:
+            result['error'] = repr(task.exception())
+            result['stopped_at'] = loop.time()
+        else:
+            task.cancel()
+            
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        
+        # Whatever VLC Scheduler has left behind
+        others = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        
+        for other in others:
+            other.cancel()
+        
+        await asyncio.gather(*others, return_exceptions=True)
+        await vlc.stop()
+    
+    started = time.monotonic()
+    loop.run_until_complete(run())
+    loop.close()
+    
+    report = {
+        'hours': args.hours,
+        'start': start.isoformat(),
+        'elapsed': time.monotonic() - started,
+        'gapless': args.gapless,
+        'latency': args.latency,
+        'jitter': args.jitter,
+        **result,
+        **analyse(vlc, config.SOURCES, start_ts, config.IMAGE_PLAY_DURATION)
+    }
+    print_report(report)
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import os, re, datetime, threading
+
+
+class DateCatalog:
+    """Files with a date in their names (FILENAME_WITH_A_DATE_PATTERN), by day.
+    
+    The date of a path is parsed once. ``split`` separates a listing into
+    the files that can be played on a given day and a count of the others,
+    which are indexed on the way. ``rollover`` uses the index to tell which
+    files leave and which join the playlists when the day changes, so that
+    the playlists can be patched instead of being built again.
+    """
+    
+    def __init__(self, pattern='^(\d\d)-(\d\d)-(\d\d\d\d).*'):
+        self.pattern = pattern
+        self._regex = re.compile(pattern)
+        self._dates = {}  # path -> date
+        self._days = {}  # date -> set of paths
+        self._day = None  # the day the playlists have been built for
+        self._lock = threading.Lock()
+    
+    def date_of(self, path):
+        # None if the name has no (valid) date in it
+        date = self._dates.get(path)
+        
+        if date is not None:
+            return date
+        
+        match = self._regex.match(os.path.basename(path))
+        
+        if not match:
+            return None
+        
+        try:
+            date = datetime.date(year=int(match[3]), month=int(match[2]), day=int(match[1]))
+        except ValueError:
+            return None
+        
+        with self._lock:
+            self._dates[path] = date
+            self._days.setdefault(date, set()).add(path)
+        
+        return date
+    
+    def discard(self, path):
+        with self._lock:
+            date = self._dates.pop(path, None)
+            
+            if date is not None:
+                self._days[date].discard(path)
+                
+                if not self._days[date]:
+                    del self._days[date]
+    
+    def split(self, paths, day):
+        # Returns the paths that can be played on day and how many have been skipped
+        playable, skipped = [], 0
+        
+        for path in paths:
+            date = self.date_of(path)
+            
+            if date is None or date == day:
+                playable.append(path)
+            else:
+                skipped += 1
+        
+        self._day = day
+        return playable, skipped
+    
+    def get_bucket(self, day):
+        with self._lock:
+            return sorted(self._days.get(day, ()))
+    
+    def rollover(self, day):
+        # Returns the paths of the previous day and those of day that still exist,
+        # or None if no listing has been split yet (the playlists have been resumed)
+        with self._lock:
+            previous, self._day = self._day, day
+            
+            if previous is None:
+                return None
+            
+            if previous == day:
+                return [], []
+            
+            removed = list(self._days.get(previous, ()))
+            added = list(self._days.get(day, ()))
+        
+        return removed, [path for path in added if os.path.isfile(path)]
+    
+    def get_upcoming(self, day, days=7):
+        # (date, number of files) for the days after day that have files
+        last = day + datetime.timedelta(days=days)
+        
+        with self._lock:
+            return [(d, len(self._days[d])) for d in sorted(self._days) if day < d <= last]
@@ -0,0 +1,71 @@
+import asyncio
+
+
+class PlayoutClock:
+    """Times items against absolute deadlines on the event loop's monotonic clock.
+    
+    Each item ends exactly ``duration`` seconds after the previous one was
+    due to end, no matter how long the HTTP calls, pings and probes around
+    the switch took, so the delays don't add up over the day. The clock
+    also learns how long a switch takes and wakes up that much earlier.
+    """
+    
+    def __init__(self, max_lag=5, max_lead=1, gain=0.25):
+        self.max_lag = max_lag
+        self.max_lead = max_lead
+        self.gain = gain
+        self.lead = 0
+        self._deadline = None
+        self.transitions = 0
+        self.last_drift = 0
+        self.max_drift = 0
+        self.total_drift = 0
+        self.slip = 0
+    
+    def now(self):
+        return asyncio.get_event_loop().time()
+    
+    def reset(self):
+        # Start a new timeline with the next item
+        self._deadline = None
+    
+    def switched(self):
+        # Called right after VLC has been told to play the next item
+        now = self.now()
+        
+        if self._deadline is None:
+            self._deadline = now
+            return
+        
+        drift = now - self._deadline
+        
+        if drift > self.max_lag:
+            # Way behind (VLC stalled?): catching up would cut items short
+            self.slip += drift
+            self._deadline = now
+            return
+        
+        self.transitions += 1
+        self.last_drift = drift
+        self.max_drift = max(self.max_drift, abs(drift))
+        self.total_drift += abs(drift)
+        self.lead = min(max(self.lead + self.gain * drift, 0), self.max_lead)
+    
+    def advance(self, duration):
+        self._deadline += duration
+    
+    def remaining(self):
+        return max(self._deadline - self.lead - self.now(), 0)
+    
+    async def sleep(self):
+        await asyncio.sleep(self.remaining())
+    
+    def get_stats(self):
+        return {
+            'transitions': self.transitions,
+            'last_drift': self.last_drift,
+            'max_drift': self.max_drift,
+            'mean_drift': self.total_drift / self.transitions if self.transitions else 0,
+            'lead': self.lead,
+            'slip': self.slip
+        }
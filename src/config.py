@@ -1,15 +1,17 @@
-import os, sys, traceback
-
-import yaml
+import os, sys, logging, traceback
 
 import defaults
 
+from mixing import MIXES
+
 CONFIG_FILENAME = 'vlcscheduler.yaml'
 CONFIG_ENV_VAR = 'VLCSCHEDULER_YAML'
 LOGGER_NAME = 'vlcscheduler'
 
-config = None
-logger = None
+# Filled in by load(), so that importing this module has no side effects
+config = type('Config', (object,), {})()
+config_path = None
+logger = logging.getLogger(LOGGER_NAME)
 
 
 class ConfigLoadError(RuntimeError):
@@ -50,7 +52,11 @@ def locate_yaml_config():
 
 
 def load_yaml_config():
-    path = os.getenv(CONFIG_ENV_VAR) or locate_yaml_config()
+    global config_path
+    
+    import yaml
+    
+    path = config_path = os.getenv(CONFIG_ENV_VAR) or locate_yaml_config()
     
     with open(path, 'r') as stream:
         try:
@@ -61,9 +67,8 @@ def load_yaml_config():
     return config
 
 
-def build_config():
-    config = type('Config', (object,), {})()
-    yaml_config = load_yaml_config()
+def build_config(config):
+    yaml_config = load_yaml_config() or {}
     
     for k in [k for k in dir(defaults) if k[0:1].isupper()]:
         new_v = getattr(defaults, k)
@@ -81,21 +86,23 @@ def build_config():
     return config
 
 
-def initialize(*args, **kwargs):
-    global config, logger
+def resolve_path(path):
+    # Relative paths in the configuration are relative to the configuration file
+    if not path:
+        return None
     
-    if config is None:
-        config = build_config()
+    return os.path.join(os.path.dirname(os.path.abspath(config_path)), path)
+
+
+def initialize(*args, **kwargs):
+    if config_path is None:
+        build_config(config)
     
-    if logger is None:
+    if not logging.getLogger().handlers:
         try:
             import coloredlogs
         except ImportError:
             coloredlogs = None
-        finally:
-            import logging
-        
-        logger = logging.getLogger(LOGGER_NAME)
         
         params = {
             'format': '%(asctime)s %(message)s',
@@ -112,19 +119,35 @@ def initialize(*args, **kwargs):
             coloredlogs.install(**params)
         else:
             logging.basicConfig(**params)
-        
-        # Other loggers
-        if not config.DEBUG:
-            logging.getLogger('schedule').setLevel(logging.WARNING)
 
 
-def check_config():
-    global config
+def get_outputs():
+    # Every output is a VLC instance with its own sources; without <outputs>
+    # the top-level <vlc>, <sources> and <ping_urls> make up a single one
+    if not config.OUTPUTS:
+        return [{
+            'name': '', 'vlc': config.VLC, 'sources': config.SOURCES,
+            'ping_urls': config.PING_URLS
+        }]
     
-    if len(config.SOURCES) == 0:
+    outputs = []
+    
+    for i, output in enumerate(config.OUTPUTS):
+        outputs.append({
+            'name': str(output.get('name') or 'output%i' % (i + 1)),
+            'vlc': {**config.VLC, **output.get('vlc', {})},
+            'sources': output.get('sources') or config.SOURCES,
+            'ping_urls': output.get('ping_urls', config.PING_URLS)
+        })
+    
+    return outputs
+
+
+def check_sources(sources):
+    if len(sources) == 0:
         raise RuntimeError('Please define at least one source in the configuration file.')
     
-    for source in config.SOURCES:
+    for source in sources:
         if not os.path.isdir(source['path']):
             raise RuntimeError('The source path is not a directory: %s.' % source['path'])
         
@@ -133,24 +156,53 @@ def check_config():
                 'Simultaneous use of <special> and <play_every_minutes> for a '
                 'single source is currently not supported.'
             )
-    
-    if not os.path.isfile(config.VLC.get('path', "")):
-        raise RuntimeError('Invalid path to VLC: %s.' % config.VLC.get('path', None))
+        
+        if int(source.get('weight', 1)) < 1:
+            raise RuntimeError('The source weight must be 1 or more: %s.' % source['path'])
 
 
-try:
-    initialize()
-    check_config()
-except RuntimeError as e:
-    print("Error: {0}".format(e))
-    sys.exit(1)
-except Exception as e:
-    if not logger:
-        import logging as logger
+def check_config():
+    global config
     
-    if config and not config.DEBUG:
-        logger.fatal(str(e))
-    else:
-        logger.fatal(traceback.format_exc())
+    outputs = get_outputs()
+    names, addresses = set(), set()
+    
+    for output in outputs:
+        check_sources(output['sources'])
+        
+        if not os.path.isfile(output['vlc'].get('path', "")):
+            raise RuntimeError('Invalid path to VLC: %s.' % output['vlc'].get('path', None))
+        
+        address = (output['vlc']['host'], int(output['vlc']['port']))
+        
+        if output['name'] in names or address in addresses:
+            raise RuntimeError(
+                'Every output needs its own name and VLC port: %s.' % output['name']
+            )
+        
+        names.add(output['name'])
+        addresses.add(address)
     
-    sys.exit(1)
+    if config.SOURCE_MIXING_FUNCTION not in MIXES:
+        raise RuntimeError(
+            'Unsupported <source_mixing_function>: %s.' % config.SOURCE_MIXING_FUNCTION
+        )
+
+
+def load():
+    # Reads vlcscheduler.yaml and sets up logging; exits if the configuration is invalid
+    try:
+        initialize()
+        check_config()
+    except RuntimeError as e:
+        print("Error: {0}".format(e))
+        sys.exit(1)
+    except Exception as e:
+        if getattr(config, 'DEBUG', 1):
+            logger.fatal(traceback.format_exc())
+        else:
+            logger.fatal(str(e))
+        
+        sys.exit(1)
+    
+    return config
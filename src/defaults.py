@@ -10,6 +10,8 @@ VLC = {
     'port': 8080,
     'password': 'vlcremote',
     'extraintf': 'http,luaintf',
+    'timeout': 5,
+    'startup_timeout': 10,
     'options': []
 }
 
@@ -22,6 +24,9 @@ else:
 
 SOURCES = []
 
+# Several VLC instances driven by one process, see README
+OUTPUTS = []
+
 FILENAME_WITH_A_DATE_PATTERN = '^(\d\d)-(\d\d)-(\d\d\d\d).*'
 
 # All extensions should be lowercase and prepended with a dot
@@ -34,6 +39,71 @@ IGNORE_PLAYING_TIME_IF_PLAYLIST_IS_EMPTY = False
 
 IMAGE_PLAY_DURATION = 60
 
+# Enqueue the next item in VLC in advance and switch to it with a single request
+GAPLESS_PLAYBACK = False
+
+# Where to remember the durations reported by VLC (relative to vlcscheduler.yaml)
+DURATION_CACHE = 'vlcscheduler-durations.sqlite'
+
+# Where to remember the contents of the source directories between restarts
+SCAN_CACHE = 'vlcscheduler-scan.cache'
+
+# Where to remember the order and the progress of the shuffled sources
+SHUFFLE_STATE = 'vlcscheduler-shuffle.json'
+
+# Where to save the playlists and the playout state, to resume after a restart
+SNAPSHOT = 'vlcscheduler-snapshot.pickle'
+SNAPSHOT_INTERVAL = 10
+
+# The full listing of every build, written by a background thread
+BUILD_REPORT = {
+    'path': 'vlcscheduler-builds.log',
+    'max_bytes': 10 * 1024 * 1024,
+    'backup_count': 3
+}
+
+REBUILD = {
+    'workers': 4,
+    'coalesce_delay': 1
+}
+
+# Where to keep the local copies of the sources with <mirror: true> (relative to vlcscheduler.yaml)
+MIRROR = {
+    'path': 'vlcscheduler-mirror',
+    'max_bytes': 10 * 1024 * 1024 * 1024,
+    'interval': 300
+}
+
+# Read the beginning of the next item ahead of time, for sources on network mounts
+PREFETCH = {
+    'enabled': False,
+    'bytes': 64 * 1024 * 1024,  # 0 for whole files
+    'rate': 16 * 1024 * 1024  # bytes per second, 0 for no limit
+}
+
 MEDIA_RECURSIVE = False
 
-PING_URLS = []
\ No newline at end of file
+PING_URLS = []
+
+PING = {
+    'workers': 2,
+    'queue_size': 100,
+    'timeout': 5,
+    'retries': 3,
+    'backoff': 1,
+    'overflow': 'drop_oldest'
+}
+
+# Prometheus-style endpoint and a periodic JSON dump of the metrics
+METRICS = {
+    'enabled': False,
+    'host': '127.0.0.1',
+    'port': 9090,
+    'dump': '',
+    'dump_interval': 60
+}
+
+WATCHER = {
+    'backend': 'auto',
+    'debounce': 3600
+}
\ No newline at end of file
@@ -0,0 +1,83 @@
+import os, sqlite3, threading, logging
+
+# Paths looked up by one query of get_many(), under SQLite's limit of variables
+QUERY_BATCH = 500
+
+
+class DurationCache:
+    """Persistent index of media durations reported by VLC.
+    
+    Entries are keyed by path and invalidated when the file's size or
+    modification time changes. With ``path=None`` the index only lives
+    in memory.
+    """
+    
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path or ':memory:', check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS durations ('
+            'path TEXT PRIMARY KEY, size INTEGER, mtime REAL, duration REAL)'
+        )
+        self._db.commit()
+    
+    def _stat(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        
+        return st.st_size, st.st_mtime
+    
+    def get(self, path):
+        key = self._stat(path)
+        
+        if key is None:
+            return None
+        
+        with self._lock:
+            row = self._db.execute(
+                'SELECT duration FROM durations WHERE path = ? AND size = ? AND mtime = ?',
+                (path, *key)
+            ).fetchone()
+        
+        return row[0] if row else None
+    
+    def get_many(self, paths):
+        # The durations stored for many paths, looked up in bulk. Unlike get()
+        # it doesn't stat the files, so a duration may be out of date: fine for
+        # estimates, e.g. the length of a playlist, that shouldn't hit the disk.
+        paths, durations = list(paths), {}
+        
+        for i in range(0, len(paths), QUERY_BATCH):
+            batch = paths[i:i + QUERY_BATCH]
+            
+            with self._lock:
+                durations.update(self._db.execute(
+                    'SELECT path, duration FROM durations WHERE path IN (%s)' % (
+                        ', '.join('?' * len(batch))
+                    ), batch
+                ))
+        
+        return durations
+    
+    def set(self, path, duration):
+        key = self._stat(path)
+        
+        if key is None or duration <= 0:
+            return
+        
+        with self._lock:
+            try:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO durations VALUES (?, ?, ?, ?)',
+                    (path, *key, duration)
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logging.warning('Cannot store the duration of %s: %s' % (path, e))
+    
+    def close(self):
+        with self._lock:
+            self._db.close()
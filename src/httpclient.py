@@ -0,0 +1,157 @@
+import asyncio, base64, json
+
+from urllib.parse import urlsplit, urlencode
+
+
+class HTTPError(Exception):
+    pass
+
+
+class HTTPConnectionError(HTTPError):
+    pass
+
+
+class HTTPTimeoutError(HTTPError):
+    pass
+
+
+class HTTPStatusError(HTTPError):
+    def __init__(self, status, reason, url):
+        super().__init__('%i %s: %s' % (status, reason, url))
+        self.status = status
+
+
+class Response:
+    def __init__(self, url, status, reason, headers, content):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.content = content
+    
+    @property
+    def text(self):
+        return self.content.decode('utf-8', 'replace')
+    
+    def json(self):
+        return json.loads(self.text)
+    
+    def raise_for_status(self):
+        if not 200 <= self.status < 300:
+            raise HTTPStatusError(self.status, self.reason, self.url)
+
+
+def _decode_chunked(body):
+    decoded = bytearray()
+    
+    while body:
+        size_line, _, body = body.partition(b'\r\n')
+        size = int(size_line.split(b';')[0] or b'0', 16)
+        
+        if size == 0:
+            break
+        
+        decoded += body[:size]
+        body = body[size + 2:]
+    
+    return bytes(decoded)
+
+
+def _parse_response(url, raw):
+    head, _, body = raw.partition(b'\r\n\r\n')
+    lines = head.decode('iso-8859-1').split('\r\n')
+    
+    try:
+        _, status, *reason = lines[0].split(' ', 2)
+        status = int(status)
+    except ValueError:
+        raise HTTPError('Malformed response from %s.' % url)
+    
+    headers = {}
+    
+    for line in lines[1:]:
+        k, _, v = line.partition(':')
+        headers[k.strip().lower()] = v.strip()
+    
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        body = _decode_chunked(body)
+    
+    return Response(url, status, reason[0] if reason else '', headers, body)
+
+
+async def _request(method, url, params, body, headers):
+    parts = urlsplit(url)
+    secure = parts.scheme == 'https'
+    port = parts.port or (443 if secure else 80)
+    target = parts.path or '/'
+    
+    if params:
+        query = params if isinstance(params, str) else urlencode(params)
+        target += '?' + (parts.query + '&' + query if parts.query else query)
+    elif parts.query:
+        target += '?' + parts.query
+    
+    if secure:
+        # Only pings may go over HTTPS, and ssl is slow to import
+        import ssl
+        context = ssl.create_default_context()
+    else:
+        context = None
+    
+    try:
+        reader, writer = await asyncio.open_connection(parts.hostname, port, ssl=context)
+    except OSError as e:
+        raise HTTPConnectionError('Cannot connect to %s: %s' % (url, e)) from e
+    
+    try:
+        headers = {
+            'Host': parts.netloc.rpartition('@')[2],
+            'Connection': 'close',  # VLC doesn't support keep-alive
+            'Content-Length': str(len(body)),
+            **headers
+        }
+        
+        request = '%s %s HTTP/1.0\r\n' % (method, target)
+        request += ''.join('%s: %s\r\n' % (k, v) for k, v in headers.items())
+        
+        writer.write(request.encode('iso-8859-1') + b'\r\n' + body)
+        await writer.drain()
+        raw = await reader.read()
+    except OSError as e:
+        raise HTTPConnectionError('Request to %s failed: %s' % (url, e)) from e
+    finally:
+        writer.close()
+    
+    return _parse_response(url, raw)
+
+
+async def request(method, url, params=None, json_body=None, auth=None, timeout=5):
+    """Perform a single HTTP/1.0 request without blocking the event loop.
+    
+    ``params`` may be a dict (urlencoded) or a ready-made query string,
+    ``auth`` is a (user, password) tuple for basic authentication.
+    The whole exchange, including connecting, is bounded by ``timeout``.
+    """
+    headers = {}
+    body = b''
+    
+    if auth:
+        credentials = base64.b64encode(('%s:%s' % auth).encode('utf-8')).decode('ascii')
+        headers['Authorization'] = 'Basic ' + credentials
+    
+    if json_body is not None:
+        body = json.dumps(json_body).encode('utf-8')
+        headers['Content-Type'] = 'application/json'
+    
+    try:
+        return await asyncio.wait_for(_request(method, url, params, body, headers), timeout)
+    except asyncio.TimeoutError as e:
+        raise HTTPTimeoutError('Request to %s timed out after %s seconds.' % (url, timeout)) from e
+
+
+async def get(url, **kwargs):
+    return await request('GET', url, **kwargs)
+
+
+async def post(url, **kwargs):
+    return await request('POST', url, **kwargs)
@@ -0,0 +1,234 @@
+import json, time, bisect, asyncio, logging, threading
+
+import utils
+
+# Seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Metric:
+    type = None
+    
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+    
+    def _format_labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        
+        if not pairs:
+            return ''
+        
+        return '{%s}' % ','.join(
+            '%s="%s"' % (k, v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for k, v in pairs
+        )
+    
+    def expose(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s %s' % (self.name, self.type)]
+        
+        with self._lock:
+            values = sorted(self._values.items())
+        
+        for key, value in values:
+            lines.append('%s%s %s' % (self.name, self._format_labels(key), _number(value)))
+        
+        return lines
+    
+    def to_dict(self):
+        with self._lock:
+            return {','.join(key) or '': value for key, value in self._values.items()}
+
+
+class Counter(Metric):
+    type = 'counter'
+    
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+    
+    def set(self, value, **labels):
+        key = self._key(labels)
+        
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+    
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+    
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        
+        with self._lock:
+            state = self._values.get(key)
+            
+            if state is None:
+                # Counts per bucket (the last one is +Inf), sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0]
+            
+            state[0][i] += 1
+            state[1] += value
+    
+    def time(self, **labels):
+        return Timer(self, labels)
+    
+    def expose(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s %s' % (self.name, self.type)]
+        
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total)
+                            in self._values.items())
+        
+        for key, (counts, total) in values:
+            cumulative = 0
+            
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                lines.append('%s_bucket%s %i' % (
+                    self.name, self._format_labels(key, [('le', le)]), cumulative
+                ))
+            
+            lines.append('%s_sum%s %s' % (self.name, self._format_labels(key), _number(total)))
+            lines.append('%s_count%s %i' % (self.name, self._format_labels(key), cumulative))
+        
+        return lines
+    
+    def to_dict(self):
+        with self._lock:
+            return {
+                ','.join(key) or '': {
+                    'count': sum(counts),
+                    'sum': total,
+                    'buckets': dict(zip([_number(b) for b in self.buckets] + ['+Inf'], counts))
+                } for key, (counts, total) in self._values.items()
+            }
+
+
+class Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Registry:
+    """Counters, gauges and histograms kept in memory.
+    
+    Updating a metric takes a dict lookup under a lock, so they are always
+    collected; the HTTP endpoint and the JSON dump are optional.
+    """
+    
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+    
+    def _get(self, cls, name, *args, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, *args, **kwargs)
+            
+            return self._metrics[name]
+    
+    def counter(self, name, help, labelnames=()):
+        return self._get(Counter, name, help, labelnames)
+    
+    def gauge(self, name, help, labelnames=()):
+        return self._get(Gauge, name, help, labelnames)
+    
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, labelnames, buckets)
+    
+    def expose(self):
+        lines = []
+        
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].expose())
+        
+        return '\n'.join(lines) + '\n'
+    
+    def to_dict(self):
+        return {name: metric.to_dict() for name, metric in sorted(self._metrics.items())}
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+
+async def _handle(reader, writer, registry):
+    try:
+        await reader.readuntil(b'\r\n\r\n')
+        body = registry.expose().encode('utf-8')
+        writer.write((
+            'HTTP/1.0 200 OK\r\n'
+            'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+            'Content-Length: %i\r\n\r\n' % len(body)
+        ).encode('ascii') + body)
+        await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host='127.0.0.1', port=9090, registry=REGISTRY):
+    # Prometheus text format on any path
+    server = await asyncio.start_server(
+        lambda reader, writer: _handle(reader, writer, registry), host, port
+    )
+    logging.info('Metrics are available at http://%s:%i/metrics.' % (host, port))
+    
+    return server
+
+
+def dump(path, registry=REGISTRY):
+    data = {'time': time.time(), 'metrics': registry.to_dict()}
+    utils.atomic_write(path, json.dumps(data, indent=1), 'the metrics')
+
+
+async def run(enabled=False, host='127.0.0.1', port=9090, dump_path=None, dump_interval=60,
+              registry=REGISTRY):
+    if not enabled and not dump_path:
+        return
+    
+    server = await serve(host, port, registry) if enabled else None
+    
+    try:
+        while True:
+            await asyncio.sleep(dump_interval if dump_path else 3600)
+            
+            if dump_path:
+                dump(dump_path, registry)
+    finally:
+        if server:
+            server.close()
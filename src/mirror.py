@@ -0,0 +1,314 @@
+import os, json, shutil, hashlib, logging, threading
+
+from collections import OrderedDict
+
+import utils, metrics
+
+from playlistfiles import is_url
+
+INDEX_NAME = 'index.json'
+HEX_DIGITS = frozenset('0123456789abcdef')
+
+MIRROR_BYTES = metrics.gauge(
+    'vlcscheduler_mirror_bytes', 'Bytes of the local copies of the mirrored sources.'
+)
+MIRROR_COPIED_BYTES = metrics.counter(
+    'vlcscheduler_mirror_copied_bytes_total', 'Bytes copied from the mirrored sources.'
+)
+MIRROR_EVICTIONS = metrics.counter(
+    'vlcscheduler_mirror_evictions_total', 'Local copies removed to stay within the size limit.'
+)
+
+
+class Mirror:
+    """Local copies of the files of slow or remote sources (``mirror: true``).
+    
+    ``sync`` makes a background thread copy the files of the mirrored
+    sources of the given playlists, the ones that play soonest first.
+    A copy keeps the size and the mtime of the original, and ``lookup``
+    returns it only while it still has them, the original otherwise.
+    The copies take at most ``max_bytes``; the least recently used ones
+    are removed first, but never to make room for a file that plays
+    later than the files already copied. The originals are read with
+    ``opener``, which can stand in for a slow share.
+    
+    The index is loaded by the thread as well, ``lookup`` returns the
+    originals until then. Only the mirror's own subdirectories of
+    ``root`` are ever cleaned up, the rest of it is left alone.
+    """
+    
+    def __init__(self, root, max_bytes=10737418240, opener=open):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.opener = opener
+        self._index = OrderedDict()  # path -> [local path, size, mtime], least recently used first
+        self._used = 0
+        self._lock = threading.Lock()
+        self._condition = threading.Condition()
+        self._playlists = None
+        self._thread = None
+        self._stopped = False
+    
+    @staticmethod
+    def _is_own_directory(name):
+        # get_local_path() names them with 16 hex digits
+        return len(name) == 16 and HEX_DIGITS.issuperset(name)
+    
+    def _load(self):
+        index_path = os.path.join(self.root, INDEX_NAME)
+        
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            entries = []
+        except Exception as e:
+            logging.warning('Ignoring the mirror index %s: %s' % (index_path, e))
+            entries = []
+        
+        loaded = OrderedDict(
+            (path, [local, size, mtime]) for path, local, size, mtime in entries
+            if self._is_valid(local, size, mtime)
+        )
+        
+        with self._lock:
+            self._index = loaded
+            self._used = sum(entry[1] for entry in loaded.values())
+            known = {entry[0] for entry in loaded.values()}
+        
+        # Whatever else is in the mirror's directories is left from an interrupted
+        # copy or an old index
+        self._remove(index_path + '.tmp')
+        
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            names = []
+        
+        for name in names:
+            directory = os.path.join(self.root, name)
+            
+            if not self._is_own_directory(name) or not os.path.isdir(directory):
+                continue
+            
+            for file_name in os.listdir(directory):
+                local = os.path.join(directory, file_name)
+                
+                if local not in known and os.path.isfile(local):
+                    self._remove(local)
+        
+        MIRROR_BYTES.set(self._used)
+    
+    def save(self):
+        with self._lock:
+            data = json.dumps([[path] + entry for path, entry in self._index.items()])
+        
+        try:
+            os.makedirs(self.root, exist_ok=True)
+        except OSError:
+            pass  # reported by atomic_write()
+        
+        utils.atomic_write(os.path.join(self.root, INDEX_NAME), data, 'the mirror index')
+    
+    def get_local_path(self, path):
+        # One directory per source directory, the file keeps its name
+        directory, name = os.path.split(path)
+        digest = hashlib.sha1(directory.encode('utf-8', 'surrogateescape')).hexdigest()
+        
+        return os.path.join(self.root, digest[:16], name)
+    
+    @staticmethod
+    def _is_valid(local, size, mtime):
+        try:
+            st = os.stat(local)
+        except OSError:
+            return False
+        
+        return st.st_size == size and st.st_mtime_ns == mtime
+    
+    @staticmethod
+    def _remove(local):
+        try:
+            os.remove(local)
+        except OSError:
+            pass
+    
+    def lookup(self, path):
+        # The local copy of path if it is complete and up to date, path otherwise
+        with self._lock:
+            entry = self._index.get(path)
+        
+        if entry is None or not self._is_valid(*entry):
+            return path
+        
+        with self._lock:
+            if path in self._index:
+                self._index.move_to_end(path)
+        
+        return entry[0]
+    
+    def list_copies(self, directory, recursive=False):
+        # The originals in directory that have been copied, sorted, for when
+        # the directory itself cannot be read
+        prefix = os.path.join(directory, '')
+        
+        with self._lock:
+            paths = [
+                path for path in self._index if path.startswith(prefix)
+                and (recursive or os.path.dirname(path) == directory)
+            ]
+        
+        return sorted(paths)
+    
+    def discard(self, path):
+        # The original has been deleted
+        with self._lock:
+            entry = self._index.pop(path, None)
+            
+            if entry:
+                self._used -= entry[1]
+        
+        if entry:
+            self._remove(entry[0])
+    
+    def sync(self, playlists):
+        # Never blocks, the files are listed and copied by the mirror's thread
+        if not self.root:
+            return
+        
+        with self._condition:
+            self._playlists = list(playlists)
+            
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='mirror', daemon=True)
+                self._thread.start()
+            
+            self._condition.notify()
+    
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+    
+    def _run(self):
+        try:
+            self._load()
+        except OSError as e:
+            logging.warning('Cannot load the mirror %s: %s' % (self.root, e))
+        
+        while True:
+            with self._condition:
+                while self._playlists is None and not self._stopped:
+                    self._condition.wait()
+                
+                if self._stopped:
+                    return
+                
+                playlists, self._playlists = self._playlists, None
+            
+            try:
+                self._sync(playlists)
+            except Exception:
+                logging.exception('Mirroring the sources has failed.')
+            
+            self.save()
+            MIRROR_BYTES.set(self._used)
+    
+    def _sync(self, playlists):
+        wanted = OrderedDict()
+        
+        for playlist in playlists:
+            for path in playlist.get_mirrored_paths():
+                if not is_url(path):
+                    wanted[path] = None
+        
+        # Copies that will play before the one being made can't be evicted for it
+        pinned = set()
+        
+        for path in wanted:
+            if self._stopped or self._playlists is not None:
+                return  # stopping, or the playlists have changed since
+            
+            try:
+                st = os.stat(path)
+            except OSError as e:
+                logging.debug('Cannot mirror %s: %s' % (path, e))
+                continue
+            
+            with self._lock:
+                entry = self._index.get(path)
+            
+            if entry and entry[1:] == [st.st_size, st.st_mtime_ns] and self._is_valid(*entry):
+                pinned.add(path)
+                continue
+            
+            if st.st_size > self.max_bytes:
+                continue
+            
+            if not self._make_room(path, st.st_size, pinned):
+                # Full of files that play sooner
+                return
+            
+            if self._copy(path, st):
+                pinned.add(path)
+    
+    def _make_room(self, path, size, pinned):
+        evicted = []
+        
+        with self._lock:
+            entry = self._index.pop(path, None)
+            
+            if entry:
+                self._used -= entry[1]
+                evicted.append(entry[0])
+            
+            for candidate in list(self._index):
+                if self._used + size <= self.max_bytes:
+                    break
+                
+                if candidate not in pinned:
+                    entry = self._index.pop(candidate)
+                    self._used -= entry[1]
+                    evicted.append(entry[0])
+                    MIRROR_EVICTIONS.inc()
+            
+            fits = self._used + size <= self.max_bytes
+        
+        for local in evicted:
+            self._remove(local)
+        
+        return fits
+    
+    def _copy(self, path, st):
+        local = self.get_local_path(path)
+        tmp_path = local + '.part'
+        
+        try:
+            os.makedirs(os.path.dirname(local), exist_ok=True)
+            
+            with self.opener(path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1048576)
+            
+            copied = os.stat(tmp_path).st_size
+            after = os.stat(path)
+            
+            if (after.st_size, after.st_mtime_ns) != (st.st_size, st.st_mtime_ns) or \
+                    copied != st.st_size:
+                logging.info('Not mirroring %s yet: it is being written to.' % path)
+                self._remove(tmp_path)
+                return False
+            
+            os.utime(tmp_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+            os.replace(tmp_path, local)
+        except OSError as e:
+            logging.warning('Cannot mirror %s: %s' % (path, e))
+            self._remove(tmp_path)
+            return False
+        
+        with self._lock:
+            self._index[path] = [local, st.st_size, st.st_mtime_ns]
+            self._used += st.st_size
+        
+        MIRROR_COPIED_BYTES.inc(st.st_size)
+        logging.debug('Mirrored %s to %s.' % (path, local))
+        return True
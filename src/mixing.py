@@ -0,0 +1,267 @@
+import abc, bisect
+
+
+class Mix(abc.ABC):
+    """A lazy, read-only sequence that interleaves the contents of several sources.
+    
+    ``sequences`` are the contents of the sources (anything with len() and
+    indexing), ``weights`` are positive integers, one per source. Nothing
+    is materialized: every item is computed from its index on demand.
+    Subclasses map an index to a (source, index in the source) pair and
+    enumerate the positions at which an item of a source occurs.
+    """
+    
+    def __init__(self, sequences, weights=None):
+        self.sequences = list(sequences)
+        self.weights = list(weights) if weights else [1] * len(self.sequences)
+        
+        if len(self.weights) != len(self.sequences) or min(self.weights, default=1) < 1:
+            raise ValueError('Invalid source weights: %r' % self.weights)
+    
+    @abc.abstractmethod
+    def __len__(self):
+        pass
+    
+    @abc.abstractmethod
+    def locate(self, index):
+        # Returns (source, index in the source) for a non-negative index
+        pass
+    
+    @abc.abstractmethod
+    def count(self, source, index):
+        # How many times an item of a source occurs in the mix
+        pass
+    
+    @abc.abstractmethod
+    def position(self, source, index, occurrence):
+        # Where the given occurrence of an item is, in ascending order
+        pass
+    
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        
+        if not 0 <= index < len(self):
+            raise IndexError('mix index out of range')
+        
+        source, source_index = self.locate(index)
+        
+        return self.sequences[source][source_index]
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    
+    def turns(self, source):
+        # How many times the items of a source occur in the mix: all of them
+        # in order, over and over, the last time perhaps only the first few.
+        # Turn t of a source is at position(source, t, 0).
+        length = len(self.sequences[source])
+        
+        if not length:
+            return 0
+        
+        repeats, lo, hi = self.count(source, 0), 0, length
+        
+        while lo < hi:
+            mid = (lo + hi) // 2
+            
+            if self.count(source, mid) < repeats:
+                hi = mid
+            else:
+                lo = mid + 1
+        
+        return (repeats - 1) * length + lo
+    
+    def find(self, source, index, hint=0):
+        # The occurrence of an item that is the closest to hint, or None
+        lo, hi = 0, self.count(source, index)
+        
+        if hi == 0:
+            return None
+        
+        while lo < hi:
+            mid = (lo + hi) // 2
+            
+            if self.position(source, index, mid) <= hint:
+                lo = mid + 1
+            else:
+                hi = mid
+        
+        candidates = [
+            self.position(source, index, i) for i in (lo - 1, lo)
+            if 0 <= i < self.count(source, index)
+        ]
+        
+        return min(candidates, key=lambda p: abs(p - hint))
+
+
+class Chain(Mix):
+    """Plays the sources one after another (weights are ignored)."""
+    
+    def __init__(self, sequences, weights=None):
+        super().__init__(sequences, weights)
+        self._offsets = [0]
+        
+        for sequence in self.sequences:
+            self._offsets.append(self._offsets[-1] + len(sequence))
+    
+    def __len__(self):
+        return self._offsets[-1]
+    
+    def locate(self, index):
+        source = bisect.bisect_right(self._offsets, index) - 1
+        
+        return source, index - self._offsets[source]
+    
+    def count(self, source, index):
+        return 1 if index < len(self.sequences[source]) else 0
+    
+    def position(self, source, index, occurrence):
+        return self._offsets[source] + index
+
+
+class ZipEqually(Mix):
+    """Takes turns between the sources until the longest one has been played through.
+    
+    ['A1'], ['B1', 'B2', 'B3'], ['C1', 'C2'] ->
+    -> 'A1', 'B1', 'C1', 'A1', 'B2', 'C2', 'A1', 'B3', 'C1'
+    
+    A source with weight 2 gets two turns in every round, spread as evenly
+    as possible among the turns of the other sources. The shorter sources
+    are repeated from the start, but their repetitions are computed
+    instead of being stored.
+    """
+    
+    def __init__(self, sequences, weights=None):
+        super().__init__(sequences, weights)
+        self._lengths = [len(s) for s in self.sequences]
+        active = [i for i, length in enumerate(self._lengths) if length]
+        
+        # Smooth weighted round-robin: the order of the turns within a round
+        self._round = []
+        self._slots = {i: [] for i in active}
+        current = {i: 0 for i in active}
+        total = sum(self.weights[i] for i in active)
+        
+        for slot in range(total):
+            for i in active:
+                current[i] += self.weights[i]
+            
+            chosen = max(active, key=lambda i: current[i])
+            current[chosen] -= total
+            self._round.append((chosen, len(self._slots[chosen])))
+            self._slots[chosen].append(slot)
+        
+        self._rounds = max(
+            [-(-self._lengths[i] // self.weights[i]) for i in active], default=0
+        )
+    
+    def __len__(self):
+        return self._rounds * len(self._round)
+    
+    def locate(self, index):
+        rounds, slot = divmod(index, len(self._round))
+        source, turn = self._round[slot]
+        
+        return source, (rounds * self.weights[source] + turn) % self._lengths[source]
+    
+    def count(self, source, index):
+        # Turns of the source are numbered index, index + length, ...
+        turns = self._rounds * self.weights[source]
+        length = self._lengths[source]
+        
+        return max(-(-(turns - index) // length), 0) if length else 0
+    
+    def position(self, source, index, occurrence):
+        rounds, turn = divmod(index + occurrence * self._lengths[source], self.weights[source])
+        
+        return rounds * len(self._round) + self._slots[source][turn]
+
+
+class Proportional(Mix):
+    """Spreads the items of every source evenly over the whole playlist.
+    
+    Nothing is repeated to pad the smaller sources: a source with 10 items
+    mixed with one of 1000 items comes up once every ~100 items. A source
+    with weight 2 is played through twice. The sources are merged in pairs,
+    so finding an item takes O(log n) steps for n sources.
+    """
+    
+    def __init__(self, sequences, weights=None):
+        super().__init__(sequences, weights)
+        self._lengths = [len(s) for s in self.sequences]
+        self._parents = {}
+        nodes = [
+            (i, self._lengths[i] * self.weights[i]) for i in range(len(self.sequences))
+            if self._lengths[i]
+        ]
+        
+        while len(nodes) > 1:
+            merged = []
+            
+            for left, right in zip(nodes[::2], nodes[1::2]):
+                node = (left, right, left[-1] + right[-1])
+                self._parents[id(left)] = (node, False)
+                self._parents[id(right)] = (node, True)
+                merged.append(node)
+            
+            if len(nodes) % 2:
+                merged.append(nodes[-1])
+            
+            nodes = merged
+        
+        self._root = nodes[0] if nodes else None
+        self._leaves = {node[0]: node for node in self._iter_leaves(self._root)}
+    
+    def _iter_leaves(self, node):
+        if node is None:
+            return
+        elif len(node) == 2:
+            yield node
+        else:
+            yield from self._iter_leaves(node[0])
+            yield from self._iter_leaves(node[1])
+    
+    def __len__(self):
+        return self._root[-1] if self._root else 0
+    
+    def locate(self, index):
+        node = self._root
+        
+        while len(node) == 3:
+            left, right, total = node
+            before = index * right[-1] // total
+            
+            if (index + 1) * right[-1] // total > before:
+                node, index = right, before
+            else:
+                node, index = left, index - before
+        
+        return node[0], index % self._lengths[node[0]]
+    
+    def count(self, source, index):
+        return self.weights[source] if index < self._lengths[source] else 0
+    
+    def position(self, source, index, occurrence):
+        node = self._leaves[source]
+        index += occurrence * self._lengths[source]
+        
+        # Inverse of locate(), from the leaf up to the root
+        while id(node) in self._parents:
+            node, is_right = self._parents[id(node)]
+            left, right, total = node
+            
+            if is_right:
+                index = -(-(index + 1) * total // right[-1]) - 1
+            else:
+                index = index * total // left[-1]
+        
+        return index
+
+
+MIXES = {
+    'chain': Chain,
+    'zip_equally': ZipEqually,
+    'proportional': Proportional
+}
@@ -0,0 +1,126 @@
+import asyncio, logging, collections
+
+from playlist import Playlist
+
+
+class PeekableQueue(asyncio.Queue):
+    """An asyncio.Queue whose waiting items can be looked at in place."""
+    
+    def _init(self, maxsize):
+        # The storage is the subclass's to define, as in asyncio.LifoQueue
+        self._queue = collections.deque()
+    
+    def peek(self):
+        return list(self._queue)
+
+
+class OutputLogger(logging.LoggerAdapter):
+    # Prefixes the messages with the name of the output, if it has one
+    def process(self, msg, kwargs):
+        if self.extra['output']:
+            return '[%s] %s' % (self.extra['output'], msg), kwargs
+        
+        return msg, kwargs
+
+
+class Output:
+    """The playlists and the queues of a single VLC instance.
+    
+    PRIMARY, SPECIAL and ADS are made of the output's own sources, while
+    ``playlist_config`` (the scan cache, the duration cache, the shuffle
+    state) is shared by all outputs. An output without a name keeps the
+    playlist names and the shuffle progress of a single-output setup.
+    """
+    
+    def __init__(self, name='', sources=(), playlist_config=None,
+                 source_mixing_function='zip_equally', ignore_playing_time_if_empty=False,
+                 logger=logging):
+        self.name = name
+        self.logger = OutputLogger(logger, {'output': name})
+        self.rebuild_events_queue = asyncio.Queue()
+        self.periodic_items_queue = PeekableQueue()
+        self.selected = None
+        self.playing = None  # the item VLC is playing, see set_playing()
+        self.ad_jobs = []  # (path, TimerScheduler job)
+        
+        playlist_config = dict(playlist_config or {})
+        prefix = name + '/' if name else ''
+        
+        if playlist_config.get('shuffle_state'):
+            playlist_config['shuffle_state'] = playlist_config['shuffle_state'].scoped(
+                name + ':' if name else ''
+            )
+        
+        self.primary = Playlist(
+            name=prefix + 'PRIMARY', **playlist_config,
+            source_mixing_function=source_mixing_function,
+            ignore_playing_time_if_empty=ignore_playing_time_if_empty
+        )
+        self.special = Playlist(
+            name=prefix + 'SPECIAL', **playlist_config,
+            source_mixing_function=source_mixing_function
+        )
+        self.adverts = Playlist(
+            name=prefix + 'ADS', **playlist_config, source_mixing_function='chain'
+        )
+        
+        for source in sources:
+            if source.get('play_every_minutes'):
+                self.adverts.add_source(source)
+            elif source.get('special'):
+                self.special.add_source(source)
+            else:
+                self.primary.add_source(source)
+    
+    def __repr__(self):
+        return '<Output %s>' % (self.name or '(default)')
+    
+    def get_playlists(self):
+        return self.primary, self.special, self.adverts
+    
+    def get_watched_paths(self):
+        return {
+            (source.path, source.recursive)
+            for playlist in self.get_playlists() for source in playlist.get_sources()
+        }
+    
+    def get_built_paths(self):
+        return {
+            (source.path, source.recursive)
+            for playlist in self.get_playlists() for source in playlist.get_built_sources()
+        }
+    
+    def set_playing(self, item):
+        # Called by the player; with gapless playback the current item of the
+        # selected playlist is the next one, already enqueued in VLC
+        self.playing = item
+    
+    def select(self):
+        # The playlist that should be played
+        return self.primary if self.special.is_empty() else self.special
+    
+    def get_revision(self):
+        return (
+            tuple(p.get_revision() for p in self.get_playlists()),
+            self.periodic_items_queue.qsize()
+        )
+    
+    def get_state(self):
+        now = asyncio.get_event_loop().time()
+        
+        return {
+            'playlists': [p.get_state() for p in self.get_playlists()],
+            'periodic_items': [item.path for item in self.periodic_items_queue.peek()],
+            'ads': {path: job.due - now for path, job in self.ad_jobs if not job.cancelled}
+        }
+    
+    def resume_playlists(self, state):
+        # Returns False if any of the playlists has to be built instead
+        return all(p.resume(s) for p, s in zip(self.get_playlists(), state['playlists']))
+    
+    def resume_periodic_items(self, state):
+        items = {item.path: item for item in self.adverts.get_items()}
+        
+        for path in state['periodic_items']:
+            if path in items:
+                self.periodic_items_queue.put_nowait(items[path])
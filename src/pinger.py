@@ -0,0 +1,101 @@
+import time, asyncio, collections, logging
+
+import httpclient, metrics
+
+PINGS = metrics.counter(
+    'vlcscheduler_pings_total', 'Pings by result: delivered, failed or dropped.', ['result']
+)
+PING_SECONDS = metrics.histogram(
+    'vlcscheduler_ping_seconds', 'Time spent delivering a ping, including retries.'
+)
+
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'coalesce')
+
+
+class PingDispatcher:
+    """Delivers "now playing" pings to PING_URLS in the background.
+    
+    ``ping`` only appends to a bounded in-memory queue; worker tasks
+    started by ``run`` post each queued name to every URL concurrently,
+    retrying failed deliveries with exponential backoff.
+    """
+    
+    def __init__(self, urls, workers=2, queue_size=100, timeout=5, retries=3,
+                 backoff=1, overflow='drop_oldest'):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError('Unsupported ping <overflow> policy: %s' % overflow)
+        
+        self.urls = list(urls or [])
+        self.workers = max(1, int(workers))
+        self.queue_size = max(1, int(queue_size))
+        self.timeout = timeout
+        self.retries = max(0, int(retries))
+        self.backoff = backoff
+        self.overflow = overflow
+        self.dropped = 0
+        self._queue = collections.deque()
+        self._wakeup = asyncio.Event()
+    
+    def ping(self, name):
+        if not self.urls:
+            return
+        
+        if len(self._queue) >= self.queue_size:
+            self.dropped += 1
+            PINGS.inc(result='dropped')
+            
+            if self.overflow == 'drop_newest':
+                logging.warning('Ping queue is full, dropping %s.' % name)
+                return
+            elif self.overflow == 'coalesce':
+                # Only the latest item is worth reporting
+                self._queue.clear()
+            else:
+                logging.warning('Ping queue is full, dropping %s.' % self._queue.popleft())
+        
+        self._queue.append(name)
+        self._wakeup.set()
+    
+    async def deliver(self, url, name):
+        started = time.perf_counter()
+        delivered = await self._deliver(url, name)
+        PING_SECONDS.observe(time.perf_counter() - started)
+        PINGS.inc(result='delivered' if delivered else 'failed')
+        
+        return delivered
+    
+    async def _deliver(self, url, name):
+        for attempt in range(self.retries + 1):
+            try:
+                resp = await httpclient.post(url, json_body={'name': name}, timeout=self.timeout)
+            except httpclient.HTTPError as e:
+                error = 'PING_URL failed={0} url={1}'.format(e, url)
+            else:
+                if resp.status == 201:
+                    return True
+                
+                error = 'PING_URL status={0} url={1}'.format(resp.status, url)
+                
+                if resp.status < 500:  # retrying won't help
+                    break
+            
+            if attempt < self.retries:
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+        
+        logging.error(error)
+        return False
+    
+    async def worker(self):
+        while True:
+            while not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            
+            name = self._queue.popleft()
+            await asyncio.gather(*[self.deliver(url, name) for url in self.urls])
+    
+    async def run(self):
+        if not self.urls:
+            return
+        
+        await asyncio.gather(*[self.worker() for i in range(self.workers)])
@@ -0,0 +1,109 @@
+import asyncio, logging, time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+REBUILD_SECONDS = metrics.histogram(
+    'vlcscheduler_rebuild_seconds', 'Time spent scanning and building all playlists.'
+)
+UPDATE_SECONDS = metrics.histogram(
+    'vlcscheduler_update_seconds', 'Time spent patching the playlists with watcher changes.'
+)
+
+
+class RebuildPipeline:
+    """Builds the PRIMARY, SPECIAL and ADS playlists of all outputs away from the event loop.
+    
+    All sources of all playlists are read in parallel on a pool of
+    ``workers`` threads, and a directory used by several playlists or
+    outputs is read once per build. The builds themselves and the patches
+    from the watchers are serialized on a single thread. Calls to
+    ``trigger`` that arrive within ``coalesce_delay`` seconds of each
+    other, or while a build is running, result in one more build.
+    """
+    
+    def __init__(self, outputs, workers=4, coalesce_delay=1, scan_cache=None,
+                 shuffle_state=None):
+        self.outputs = list(outputs)
+        self.coalesce_delay = coalesce_delay
+        self.scan_cache = scan_cache
+        self.shuffle_state = shuffle_state
+        self._scan_executor = ThreadPoolExecutor(max_workers=max(1, int(workers)))
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._triggered = asyncio.Event()
+    
+    def get_playlists(self):
+        return [p for output in self.outputs for p in output.get_playlists()]
+    
+    def build(self):
+        # Returns the playlist that should be played, for every output
+        started = time.monotonic()
+        playlists = self.get_playlists()
+        listings = {}
+        scanned = [p.scan(executor=self._scan_executor, listings=listings) for p in playlists]
+        
+        for playlist, playlist_scanned in zip(playlists, scanned):
+            playlist.build(executor=self._scan_executor, scanned=playlist_scanned)
+        
+        if self.scan_cache:
+            self.scan_cache.save()
+        
+        if self.shuffle_state:
+            self.shuffle_state.save()
+        
+        elapsed = time.monotonic() - started
+        REBUILD_SECONDS.observe(elapsed)
+        logging.debug('Playlists have been built from %i listing(s) in %.3f seconds.' % (
+            len(listings), elapsed
+        ))
+        
+        return [output.select() for output in self.outputs]
+    
+    def apply_changes(self, changes):
+        # Returns, for every output, which playlists have changed and
+        # whether the playlist to be played has to be chosen again
+        results = []
+        
+        with UPDATE_SECONDS.time():
+            for output in self.outputs:
+                was_empty = [p.is_empty() for p in (output.primary, output.special)]
+                updated = [p.apply_changes(changes) for p in output.get_playlists()]
+                reselect = [p.is_empty() for p in (output.primary, output.special)] != was_empty
+                results.append((updated, reselect))
+        
+        return results
+    
+    def resume(self, states):
+        # Like build(), but from the states saved in a snapshot.
+        # Returns None if the playlists have to be built after all.
+        if len(states) != len(self.outputs):
+            return None
+        
+        for output, state in zip(self.outputs, states):
+            if not output.resume_playlists(state):
+                return None
+        
+        return [output.select() for output in self.outputs]
+    
+    async def _run_in_executor(self, func, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._executor, func, *args)
+    
+    async def rebuild(self):
+        return await self._run_in_executor(self.build)
+    
+    async def restore(self, states):
+        return await self._run_in_executor(self.resume, states)
+    
+    async def update(self, changes):
+        return await self._run_in_executor(self.apply_changes, changes)
+    
+    def trigger(self):
+        self._triggered.set()
+    
+    async def run(self, on_rebuild):
+        while True:
+            await self._triggered.wait()
+            await asyncio.sleep(self.coalesce_delay)
+            self._triggered.clear()
+            on_rebuild(await self.rebuild())
@@ -1,40 +1,207 @@
-import os, re, logging, datetime, random, itertools, types
+import os, time, heapq, bisect, logging, datetime, threading, types
 
-import utils
+from array import array
+
+import utils, metrics, report
+
+from mixing import MIXES
+from shuffle import ShuffleState
+from playlistfiles import PlaylistFileCache, PlaylistFileError
+from catalog import DateCatalog
+from timeline import Timeline
+
+# Same values as watchgod.Change
+ADDED, MODIFIED, DELETED = 1, 2, 3
+
+# Playlist entries are integers: the id of the path in the PathTable
+# shifted left by SOURCE_BITS, plus the index of the source
+SOURCE_BITS = 16
+SOURCE_MASK = (1 << SOURCE_BITS) - 1
+
+# Shuffled sources with at least this many files get the order of their
+# next cycle sorted in the background
+PREPARED_CYCLE_SIZE = 10000
+
+BUILD_SECONDS = metrics.histogram(
+    'vlcscheduler_playlist_build_seconds', 'Time spent building a playlist.', ['playlist']
+)
+BUILD_PHASE_SECONDS = metrics.histogram(
+    'vlcscheduler_playlist_build_phase_seconds',
+    'Time spent reading the sources (scan) and mixing them (mix).', ['playlist', 'phase']
+)
+PLAYLIST_FILES = metrics.gauge(
+    'vlcscheduler_playlist_files', 'Files in the sources of a playlist.', ['playlist']
+)
+PLAYLIST_ITEMS = metrics.gauge(
+    'vlcscheduler_playlist_items', 'Items in one pass through a playlist.', ['playlist']
+)
+
+
+class PathTable:
+    """Stores many paths compactly: each directory is kept once, and all
+    file names are concatenated into a single blob of UTF-8 bytes."""
+    
+    def __init__(self):
+        self._dirs = []
+        self._dir_ids = {}
+        self._names = bytearray()
+        self._offsets = array('Q', [0])
+        self._parents = array('I')
+        self._ids = None
+    
+    def __len__(self):
+        return len(self._parents)
+    
+    def __getitem__(self, path_id):
+        name = self._names[self._offsets[path_id]:self._offsets[path_id + 1]]
+        
+        return os.path.join(
+            self._dirs[self._parents[path_id]], name.decode('utf-8', 'surrogateescape')
+        )
+    
+    def add(self, path):
+        directory, name = os.path.split(path)
+        
+        if os.path.join(directory, name) != path:  # e.g. URLs
+            directory, name = '', path
+        
+        dir_id = self._dir_ids.get(directory)
+        
+        if dir_id is None:
+            dir_id = self._dir_ids[directory] = len(self._dirs)
+            self._dirs.append(directory)
+        
+        self._names += name.encode('utf-8', 'surrogateescape')
+        self._offsets.append(len(self._names))
+        self._parents.append(dir_id)
+        
+        path_id = len(self._parents) - 1
+        
+        if self._ids is not None:
+            self._ids.setdefault(path, []).append(path_id)
+        
+        return path_id
+    
+    def __getstate__(self):
+        # The reverse index is rebuilt on demand
+        return {**self.__dict__, '_ids': None}
+    
+    def copy(self):
+        table = PathTable()
+        table._dirs = list(self._dirs)
+        table._dir_ids = dict(self._dir_ids)
+        table._names = bytearray(self._names)
+        table._offsets = array('Q', self._offsets)
+        table._parents = array('I', self._parents)
+        return table
+    
+    def find(self, path):
+        # All the ids of path: a build adds a path once for every source that
+        # has it, e.g. for a directory and its subdirectory that are both sources.
+        # The reverse index is only built once it's needed (by the watchers).
+        if self._ids is None:
+            self._ids = {}
+            
+            for i in range(len(self)):
+                self._ids.setdefault(self[i], []).append(i)
+        
+        return self._ids.get(path, ())
+
+
+class PlaylistItem:
+    __slots__ = ('path', 'source', '_mirror')
+    
+    def __init__(self, path, source, mirror=None):
+        self.path = path
+        self.source = source
+        self._mirror = mirror
+    
+    @property
+    def location(self):
+        # What VLC opens: the valid local copy of a mirrored source's file, path otherwise
+        if self._mirror and self.source.mirror:
+            return self._mirror.lookup(self.path)
+        
+        return self.path
+    
+    def __repr__(self):
+        return 'PlaylistItem(%r)' % self.path
+
+
+class PlaylistItems:
+    """A read-only sequence of PlaylistItem views over encoded entries."""
+    
+    def __init__(self, entries, table, sources, mirror=None):
+        self._entries = entries
+        self._table = table
+        self._sources = sources
+        self._mirror = mirror
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def __getitem__(self, index):
+        entry = self._entries[index]
+        path, source = self._table[entry >> SOURCE_BITS], self._sources[entry & SOURCE_MASK]
+        return PlaylistItem(path, source, self._mirror)
+    
+    def __iter__(self):
+        for i in range(len(self._entries)):
+            yield self[i]
 
 
 class Playlist:
     def __init__(self, sources=[], name='Untitled', allowed_extensions=[],
                  source_mixing_function='zip_equally', recursive=False, 
                  filename_with_a_date_pattern='^(\d\d)-(\d\d)-(\d\d\d\d).*',
-                 ignore_playing_time_if_empty=False):
+                 ignore_playing_time_if_empty=False, duration_cache=None, scan_cache=None,
+                 shuffle_state=None, wall_time=time.time, playlist_extensions=(),
+                 playlist_file_cache=None, date_catalog=None, mirror=None):
         
         self._sources = []
+        self._timeline = None
         
         # Process kwargs
         self.add_source(*sources)
         self.name = name
         self._allowed_extensions = allowed_extensions
-        self._filename_with_a_date_regex = re.compile(filename_with_a_date_pattern)
+        self._date_catalog = date_catalog or DateCatalog(filename_with_a_date_pattern)
         self._ignore_playing_time_if_empty = ignore_playing_time_if_empty
         self._recursive = recursive
+        self._duration_cache = duration_cache
+        self._scan_cache = scan_cache
+        self._shuffle_state = shuffle_state or ShuffleState()
+        self._playlist_extensions = tuple(playlist_extensions)
+        self._playlist_file_cache = playlist_file_cache or PlaylistFileCache()
+        self._mirror = mirror
+        self._wall_time = wall_time
+        self._lock = threading.Lock()
+        self._table = PathTable()
+        self._items = array('Q')
+        self._contents = []
+        self._cursors = []  # how many files of each shuffled source played in this cycle
+        self._next_cycles = {}
+        self._present = None  # the entries in the contents, built by _apply_changes
+        self._position = 0
+        self._current = None
+        self._built_on = None
         
         # self._source_mixing_function
-        if source_mixing_function == 'zip_equally':
-            self._source_mixing_function = utils.zip_equally
-        elif source_mixing_function == 'chain':
-            self._source_mixing_function = itertools.chain
+        if source_mixing_function in MIXES:
+            self._source_mixing_function = MIXES[source_mixing_function]
         else:
             raise ValueError('Unsupported <source_mixing_function>')
     
     def prepare_source(self, source):
         prepared = types.SimpleNamespace(
             active=True,
-            path=source['path'],
+            path=os.path.normpath(source['path']),
             shuffle=bool(source.get('shuffle', False)),
             recursive=bool(source.get('recursive', self._recursive)),
             item_play_duration=int(source.get('item_play_duration', 0)),
             play_every_minutes=int(source.get('play_every_minutes', 0)),
+            weight=int(source.get('weight', 1)),
+            mirror=bool(source.get('mirror', False)),
             start_time=None,
             end_time=None
         )
@@ -50,66 +217,153 @@ class Playlist:
     def add_source(self, *sources):
         for source in sources:
             self._sources.append(self.prepare_source(source))
+        
+        self._timeline = None
+    
+    def now(self):
+        return datetime.datetime.fromtimestamp(self._wall_time())
     
     def get_sources(self):
         return self._sources
     
+    def get_built_sources(self):
+        # The sources that the playlist has been built from
+        return [s for s, c in self._contents]
+    
     def get_active_sources(self):
         for source in self.get_sources():
             if source.active:
                 yield source
     
-    def check_sources(self):
-        now_time = datetime.datetime.now().time()
+    def get_timeline(self):
+        # Compiled once from the <playing_time> of the sources
+        if self._timeline is None:
+            self._timeline = Timeline([
+                (i, source.start_time, source.end_time)
+                for i, source in enumerate(self.get_sources())
+                if source.start_time and source.end_time
+            ])
         
-        for source in self.get_sources():
-            source.active = True
-            
-            if source.start_time and source.end_time:
-                if not utils.is_time_within_interval(now_time, source.start_time, source.end_time):
-                    source.active = False
+        return self._timeline
+    
+    def check_sources(self, now_time=None):
+        active = self.get_timeline().active_at(now_time or self.now().time())
+        
+        for i, source in enumerate(self.get_sources()):
+            source.active = not (source.start_time and source.end_time) or i in active
     
     def get_rebuild_schedule(self):
-        rebuild_schedule = []
+        return self.get_timeline().boundaries
+    
+    def is_playable_today(self, path):
+        date = self._date_catalog.date_of(path)
         
-        for source in self.get_sources():
-            for time in (source.start_time, source.end_time):                
-                if time and time not in rebuild_schedule:
-                    rebuild_schedule.append(time)
+        if date is not None:
+            if date != self.now().date():
+                logging.warning(
+                    'Skipping: %s (reason: filename date ≠ today).' % path
+                )
+                return False
         
-        return sorted(rebuild_schedule)
+        return True
     
-    def get_source_contents(self, source):
-        paths = list(utils.list_files_with_extensions(
-            source.path, self._allowed_extensions, recursive=source.recursive
-        ))
+    def is_in_source(self, source, path):
+        if not path.lower().endswith(self._allowed_extensions):
+            return False
+        
+        if path.lower().endswith(self._playlist_extensions):
+            # Only a build expands playlist files
+            return False
+        
+        parent = os.path.dirname(path)
         
-        if source.shuffle:
-            random.shuffle(paths)
+        if source.recursive:
+            return parent == source.path or parent.startswith(source.path + os.sep)
         else:
-            paths = sorted(paths)
+            return parent == source.path
+    
+    def list_source(self, source):
+        # The files that can be played today, sorted, with the playlist files expanded
+        try:
+            listed = sorted(utils.list_files_with_extensions(
+                source.path, self._allowed_extensions, recursive=source.recursive,
+                cache=self._scan_cache
+            ))
+        except OSError as e:
+            if not (source.mirror and self._mirror):
+                raise
+            
+            # The share is down, play what has been copied from it
+            logging.warning('Cannot read %s, playing its copies in the mirror: %s' % (
+                source.path, e
+            ))
+            listed = [
+                path for path in self._mirror.list_copies(source.path, source.recursive)
+                if path.lower().endswith(self._allowed_extensions)
+            ]
+        
+        paths, skipped = self._date_catalog.split(listed, self.now().date())
+        
+        if skipped:
+            logging.info('Skipping %i file(s) in %s (reason: filename date ≠ today).' % (
+                skipped, source.path
+            ))
         
+        return list(self.expand_playlist_files(paths))
+    
+    def expand_playlist_files(self, paths):
         for path in paths:
-            match = self._filename_with_a_date_regex.match(os.path.basename(path))
+            if not path.lower().endswith(self._playlist_extensions):
+                yield path
+                continue
             
-            if match:
-                date = datetime.date(
-                    year=int(match[3]),
-                    month=int(match[2]),
-                    day=int(match[1])
-                )
+            try:
+                entries = list(self._playlist_file_cache.expand(path, self._playlist_extensions))
+            except PlaylistFileError as e:
+                logging.warning('Cannot read %s, passing it to VLC as it is: %s' % (path, e))
+                yield path
+            else:
+                if not entries:
+                    logging.warning('Skipping: %s (reason: nothing to play in it).' % path)
                 
-                if date != datetime.date.today():
-                    logging.warning(
-                        'Skipping: %s (reason: filename date ≠ today).' % path
-                    )
-                    continue
-            
-            yield types.SimpleNamespace(path=path, source=source)
+                yield from entries
+    
+    def get_listing_key(self, source):
+        # Sources with equal keys have equal listings, even in different playlists
+        return (source.path, source.recursive, self._allowed_extensions,
+                self._playlist_extensions, self._date_catalog.pattern)
     
-    def build(self, use_only_active_sources=True):
-        self._items = []
+    def order_source(self, source, paths):
+        # Returns the paths in the order they play and how many of them have
+        # been played in the current cycle (always 0 unless shuffled)
+        if not source.shuffle:
+            return paths, 0
         
+        # The same order until every file has been played, even across rebuilds
+        ordered, played = self._shuffle_state.order(source.path, paths)
+        
+        if ordered and played >= len(ordered):
+            # The files that were left to play are gone, so the next cycle starts
+            self._shuffle_state.new_cycle(source.path)
+            ordered, played = self._shuffle_state.order(source.path, paths)
+        
+        return ordered, played
+    
+    def get_source_contents(self, source):
+        for path in self.order_source(source, self.list_source(source))[0]:
+            yield PlaylistItem(path, source)
+    
+    def mix(self, contents):
+        # A lazy view, the contents are not copied. The mix only decides whose
+        # turn it is for a shuffled source, its cursor decides which file plays.
+        return self._source_mixing_function(
+            [c for s, c in contents], [s.weight for s, c in contents]
+        )
+    
+    def scan(self, use_only_active_sources=True, executor=None, listings=None):
+        # Starts listing the sources. With an executor, the sources are read
+        # in parallel and the listings in the returned pairs are futures.
+        # Listings already in the ``listings`` dict are reused, not read again.
         self.check_sources()
         
         if use_only_active_sources:
@@ -117,12 +371,64 @@ class Playlist:
         else:
             sources = list(self.get_sources())
         
-        contents = [list(self.get_source_contents(s)) for s in sources]
+        if listings is None:
+            listings = {}
+        
+        scanned = []
+        
+        for source in sources:
+            key = self.get_listing_key(source)
+            
+            if key not in listings:
+                if executor:
+                    listings[key] = executor.submit(self.list_source, source)
+                else:
+                    listings[key] = self.list_source(source)
+            
+            scanned.append((source, listings[key]))
+        
+        return scanned
+    
+    def build(self, use_only_active_sources=True, executor=None, scanned=None):
+        started = time.perf_counter()
+        
+        if scanned is None:
+            scanned = self.scan(use_only_active_sources, executor)
+        
+        if len(scanned) > SOURCE_MASK + 1:
+            raise ValueError('Too many sources in playlist %s.' % self.name)
         
-        for item in self._source_mixing_function(*contents):
-            self._items.append(item)
+        table = PathTable()
+        sources = [s for s, c in scanned]
+        contents, cursors = [], []
         
-        self._items_cycle = itertools.cycle(self._items)
+        for i, (s, c) in enumerate(scanned):
+            paths, cursor = self.order_source(s, c.result() if hasattr(c, 'result') else c)
+            contents.append(array('Q', ((table.add(p) << SOURCE_BITS) | i for p in paths)))
+            cursors.append(cursor)
+        
+        scanned_at = time.perf_counter()
+        items = self.mix(list(zip(sources, contents)))
+        finished = time.perf_counter()
+        
+        BUILD_SECONDS.observe(finished - started, playlist=self.name)
+        BUILD_PHASE_SECONDS.observe(scanned_at - started, playlist=self.name, phase='scan')
+        BUILD_PHASE_SECONDS.observe(finished - scanned_at, playlist=self.name, phase='mix')
+        PLAYLIST_FILES.set(sum(len(c) for c in contents), playlist=self.name)
+        PLAYLIST_ITEMS.set(len(items), playlist=self.name)
+        
+        # Swap the new contents in all at once, get_next() may run in another thread
+        with self._lock:
+            self._table = table
+            self._contents = list(zip(sources, contents))
+            self._cursors = cursors
+            self._next_cycles = {}
+            self._present = None
+            self._items = items
+            self._position = 0
+            self._current = None
+            self._built_on = self.now().date()
+            self._prepare_cycles()
         
         if self.is_empty():
             if use_only_active_sources and self._ignore_playing_time_if_empty:
@@ -130,24 +436,503 @@ class Playlist:
                     'Building playlist %s while ignoring '
                     '<playing_time> of the sources.'
                 ) % self.name)
-                return self.build(use_only_active_sources=False)
+                return self.build(use_only_active_sources=False, executor=executor)
             else:
                 logging.warning('Playlist %s is empty.' % self.name)
         else:
             num_s = len(sources)
-            num_f = len([i for c in contents for i in c])
+            num_f = sum(len(c) for c in contents)
             
-            logging.info(
-                'Playlist %s has been built from %i source(s) and %i file(s).' % (
-                    self.name, num_s, num_f
-                ) + '\n\t' + '\n\t'.join([i.path for i in self._items])
+            summary = 'Playlist %s has been built from %i source(s) and %i file(s).' % (
+                self.name, num_s, num_f
             )
+            
+            if self._duration_cache:
+                known, unknown = self.get_duration()
+                summary += ' Known duration: %s' % datetime.timedelta(seconds=round(known))
+                
+                if unknown:
+                    summary += ' (+%i item(s) of unknown length)' % unknown
+                
+                summary += '.'
+            
+            logging.info(summary)
+            
+            if report.is_enabled():
+                self.report_build(summary, table, sources, contents, (
+                    scanned_at - started, finished - scanned_at
+                ))
+    
+    def report_build(self, summary, table, sources, contents, timings):
+        # The full listing goes to the build report, formatted by its own thread.
+        # The arrays are copied because apply_changes() edits them in place.
+        listed = [(s.path, array('Q', c)) for s, c in zip(sources, contents)]
+        
+        def lines():
+            for path, c in listed:
+                yield '%s (%i file(s)):' % (path, len(c))
+                
+                for entry in c:
+                    yield '\t' + table[entry >> SOURCE_BITS]
+        
+        report.listing('%s Scan: %.3f s, mix: %.3f s.' % ((summary,) + timings), lines)
     
     def is_empty(self):
         return len(self._items) <= 0
     
+    def get_revision(self):
+        # Changes whenever the playlist is rebuilt, patched or advanced
+        return id(self._items), self._position
+    
+    def get_state(self):
+        # A copy of everything that resume() needs, taken at once
+        with self._lock:
+            indices = {id(s): i for i, s in enumerate(self._sources)}
+            
+            return {
+                'active': [i for i, s in enumerate(self._sources) if s.active],
+                'sources': [indices[id(s)] for s, c in self._contents],
+                'built_on': self._built_on,
+                'table': self._table.copy(),
+                'contents': [array('Q', c) for s, c in self._contents],
+                'cursors': list(self._cursors),
+                'position': self._position,
+                'current': self._current
+            }
+    
+    def resume(self, state):
+        """Restores the playlist from get_state() instead of building it.
+        
+        Returns False, leaving the playlist as it was, if the state is from
+        another day or the sources that are playing now have changed.
+        """
+        self.check_sources()
+        
+        if (state['built_on'] != self.now().date() or len(state['sources']) > len(self._sources)
+                or state['active'] != [i for i, s in enumerate(self._sources) if s.active]):
+            return False
+        
+        contents = [(self._sources[i], c) for i, c in zip(state['sources'], state['contents'])]
+        items = self.mix(contents)
+        
+        PLAYLIST_FILES.set(sum(len(c) for s, c in contents), playlist=self.name)
+        PLAYLIST_ITEMS.set(len(items), playlist=self.name)
+        
+        with self._lock:
+            self._table = state['table']
+            self._contents = contents
+            self._cursors = list(state['cursors'])
+            self._next_cycles = {}
+            self._present = None
+            self._prepare_cycles()
+            self._items = items
+            self._position = state['position']
+            self._current = state['current']
+            self._built_on = state['built_on']
+        
+        if not self.is_empty():
+            logging.info('Playlist %s has been resumed at item %i of %i.' % (
+                self.name, self._position % len(self._items) + 1, len(self._items)
+            ))
+        
+        return True
+    
     def get_items(self):
-        return self._items
+        return PlaylistItems(
+            self._items, self._table, [s for s, c in self._contents], self._mirror
+        )
+    
+    def _get_item(self, entry):
+        path, source = self._table[entry >> SOURCE_BITS], self._contents[entry & SOURCE_MASK][0]
+        return PlaylistItem(path, source, self._mirror)
+    
+    def get_duration(self):
+        # Returns the length of one pass through the playlist in seconds
+        # and the number of items whose length is not known yet
+        known, unknown = 0, 0
+        
+        for i, (source, contents) in enumerate(self._contents):
+            if source.item_play_duration <= 0:
+                # All at once and without statting the files (it's an estimate)
+                paths = [self._table[entry >> SOURCE_BITS] for entry in contents]
+                lengths = self._duration_cache.get_many(paths) if self._duration_cache else {}
+            
+            for k in range(len(contents)):
+                # Repeated items are looked up once
+                occurrences = self._items.count(i, k)
+                play_duration = source.item_play_duration
+                
+                if play_duration <= 0:
+                    length = lengths.get(paths[k])
+                    
+                    if length is None:
+                        unknown += occurrences
+                        continue
+                    
+                    play_duration = min(length, -play_duration) if play_duration < 0 else length
+                
+                known += play_duration * occurrences
+        
+        return known, unknown
+    
+    def get_current(self):
+        with self._lock:
+            if self._current is None:
+                return None
+            
+            return self._get_item(self._current)
     
     def get_next(self):
-        return next(self._items_cycle)
+        with self._lock:
+            if self.is_empty():
+                raise StopIteration
+            
+            self._position %= len(self._items)
+            source, index = self._items.locate(self._position)
+            self._position += 1
+            
+            if self._contents[source][0].shuffle:
+                self._current = self._take_shuffled(source)
+            else:
+                self._current = self._contents[source][1][index]
+            
+            return self._get_item(self._current)
+    
+    def peek_next(self):
+        # The item get_next() would return, or None
+        with self._lock:
+            if self.is_empty():
+                return None
+            
+            source, index = self._items.locate(self._position % len(self._items))
+            shuffled, contents = self._contents[source][0].shuffle, self._contents[source][1]
+            
+            if shuffled:
+                index = self._cursors[source]
+            
+            return self._get_item(contents[index % len(contents)])
+    
+    def get_mirrored_paths(self):
+        # The files of the mirrored sources in about the order they will be
+        # played: every source from its next file on, the sources interleaved
+        # as evenly as the mix spreads them. Only copies of the contents are
+        # made under the lock.
+        with self._lock:
+            if self.is_empty():
+                return []
+            
+            table, mirrored = self._table, []
+            
+            for i, (source, contents) in enumerate(self._contents):
+                if not source.mirror or not contents:
+                    continue
+                
+                if source.shuffle:
+                    # Every turn takes the file at the cursor
+                    turn, turns = self._cursors[i], self._cursors[i] + len(contents)
+                else:
+                    turns = self._items.turns(i)
+                    turn = self._next_turn(i, turns, self._position % len(self._items))
+                
+                mirrored.append((array('Q', contents), turn, turns))
+        
+        def play_order(contents, turn, turns):
+            # Turn t plays file t % length, after the last one the next pass starts
+            seen, k = bytearray(len(contents)), 0
+            
+            while k < len(contents):
+                index = (turn if turn < turns else turn - turns) % len(contents)
+                turn += 1
+                
+                if not seen[index]:
+                    seen[index] = True
+                    yield k / len(contents), contents[index]
+                    k += 1
+        
+        return [table[entry >> SOURCE_BITS] for k, entry in heapq.merge(*(
+            play_order(*source) for source in mirrored
+        ))]
+    
+    def _next_turn(self, source, turns, position):
+        # The first turn of a source from position on in the mix (or turns
+        # if there are none left in this pass)
+        lo, hi = 0, turns
+        
+        while lo < hi:
+            mid = (lo + hi) // 2
+            
+            if self._items.position(source, mid, 0) < position:
+                lo = mid + 1
+            else:
+                hi = mid
+        
+        return lo
+    
+    def _take_shuffled(self, source):
+        # The next file of a shuffled source is the one at its cursor, whichever
+        # turn of the mix it is: every file once per cycle, never twice
+        key, contents = self._contents[source][0].path, self._contents[source][1]
+        
+        if self._cursors[source] >= len(contents):
+            # What was left of the cycle has been removed
+            self._new_cycle(source)
+        
+        entry = contents[self._cursors[source]]
+        self._cursors[source] += 1
+        self._shuffle_state.played(
+            key, self._shuffle_state.ranker(key)(self._table[entry >> SOURCE_BITS])
+        )
+        
+        if self._cursors[source] >= len(contents):
+            self._new_cycle(source)
+        
+        return entry
+    
+    def _new_cycle(self, source):
+        # Put the contents of a shuffled source in the order of its new cycle.
+        # A big source gets it sorted in the background while the cycle before
+        # plays and kept up to date with the changes (_update_prepared).
+        key, contents = self._contents[source][0].path, self._contents[source][1]
+        epoch = self._shuffle_state.new_cycle(key)
+        rank = self._shuffle_state.ranker(key, epoch)
+        prepared = self._next_cycles.pop(source, None)
+        
+        if (prepared and prepared[0] is self._table and prepared[1] == epoch
+                and prepared[4] is not None):
+            ordered = prepared[4]
+        else:
+            ordered = array('Q', (entry for r, entry in sorted(
+                (rank(self._table[entry >> SOURCE_BITS]), entry) for entry in contents
+            )))
+        
+        contents[:] = ordered
+        self._cursors[source] = 0
+        self._prepare_cycle(source, epoch + 1)
+    
+    def _prepare_cycles(self):
+        for i, (source, contents) in enumerate(self._contents):
+            if source.shuffle:
+                self._prepare_cycle(i, self._shuffle_state.epoch(source.path) + 1)
+    
+    def _prepare_cycle(self, source, epoch):
+        key, contents = self._contents[source][0].path, self._contents[source][1]
+        
+        if len(contents) < PREPARED_CYCLE_SIZE:
+            return
+        
+        table, entries = self._table, array('Q', contents)
+        rank = self._shuffle_state.ranker(key, epoch)
+        # [table, epoch, ranker, ranks, entries, changes made while sorting]
+        prepared = self._next_cycles[source] = [table, epoch, rank, None, None, []]
+        
+        def prepare():
+            ranked = sorted((rank(table[entry >> SOURCE_BITS]), entry) for entry in entries)
+            ranks = array('Q', (r for r, entry in ranked))
+            ordered = array('Q', (entry for r, entry in ranked))
+            
+            with self._lock:
+                if self._next_cycles.get(source) is not prepared:
+                    return
+                
+                prepared[3], prepared[4] = ranks, ordered
+                
+                for change in prepared[5]:
+                    self._update_prepared(source, *change)
+                
+                prepared[5] = None
+        
+        threading.Thread(target=prepare, name='shuffle', daemon=True).start()
+    
+    def _update_prepared(self, source, entry, path, added):
+        prepared = self._next_cycles.get(source)
+        
+        if not prepared or prepared[0] is not self._table:
+            return
+        
+        if prepared[4] is None:
+            prepared[5].append((entry, path, added))
+            return
+        
+        ranks, entries = prepared[3], prepared[4]
+        r = prepared[2](path)
+        i = bisect.bisect_left(ranks, r)
+        
+        if added:
+            ranks.insert(i, r)
+            entries.insert(i, entry)
+            return
+        
+        while i < len(ranks) and ranks[i] == r:
+            if entries[i] == entry:
+                del ranks[i], entries[i]
+                return
+            
+            i += 1
+    
+    def apply_changes(self, changes):
+        """Patch the playlist in place with (change, path) pairs yielded by awatch.
+        
+        Files are added to or removed from the contents of the sources they
+        belong to without rescanning anything. The position in the playlist is
+        kept, so the current item goes on playing unless it was deleted.
+        Returns True if the playlist has changed.
+        """
+        with self._lock:
+            return self._apply_changes(changes)
+    
+    def _apply_changes(self, changes):
+        changed = False
+        
+        if self._present is None:
+            self._present = set()
+            
+            for source, contents in self._contents:
+                self._present.update(contents)
+        
+        for change, path in changes:
+            if change == MODIFIED:
+                continue
+            
+            # The same form as the paths of the sources (prepare_source)
+            path = os.path.normpath(path)
+            
+            for i, (source, contents) in enumerate(self._contents):
+                if not self.is_in_source(source, path):
+                    continue
+                
+                path_ids = self._table.find(path)
+                entry = next((
+                    e for e in ((path_id << SOURCE_BITS) | i for path_id in path_ids)
+                    if e in self._present
+                ), None)
+                
+                if change == DELETED:
+                    self._date_catalog.discard(path)
+                
+                if change == DELETED and entry is not None:
+                    if source.shuffle:
+                        self._update_prepared(i, entry, path, False)
+                        self._remove_shuffled(i, entry)
+                    else:
+                        contents.pop(self._index(i, entry))
+                    
+                    self._present.discard(entry)
+                    changed = True
+                elif change == ADDED and entry is None and self.is_playable_today(path):
+                    path_id = path_ids[0] if path_ids else self._table.add(path)
+                    entry = (path_id << SOURCE_BITS) | i
+                    
+                    if source.shuffle:
+                        self._update_prepared(i, entry, path, True)
+                        self._add_shuffled(i, entry, path)
+                    else:
+                        contents.insert(self._bisect(contents, path), entry)
+                    
+                    self._present.add(entry)
+                    changed = True
+        
+        if changed:
+            self.restore_position(self._current, self._position - 1)
+        
+        return changed
+    
+    def _remove_shuffled(self, source, entry):
+        # Keep the cursor on the same unplayed file
+        contents = self._contents[source][1]
+        index = self._index(source, entry)
+        contents.pop(index)
+        
+        if index < self._cursors[source]:
+            self._cursors[source] -= 1
+        
+        if contents and self._cursors[source] >= len(contents):
+            # That was the last file left to play in this cycle
+            self._new_cycle(source)
+    
+    def _add_shuffled(self, source, entry, path):
+        # Among the files left to play in this cycle, where its rank puts it,
+        # unless it has been played in this cycle already
+        key, contents = self._contents[source][0].path, self._contents[source][1]
+        get_rank = self._shuffle_state.ranker(key)
+        rank = get_rank(path)
+        
+        if self._shuffle_state.was_played(key, rank):
+            contents.insert(self._cursors[source], entry)
+            self._cursors[source] += 1
+        else:
+            # The files left to play are in the order of their ranks
+            contents.insert(self._bisect(
+                contents, rank, get_rank, self._cursors[source], len(contents)
+            ), entry)
+    
+    def _index(self, source, entry):
+        # Where entry is in the contents of source, found by bisecting them:
+        # shuffled contents are in the order of the ranks on either side of the
+        # cursor, the others are sorted by path. Entries that break that order
+        # (from expanded playlist files, or played files added in the middle of
+        # a cycle) are left to a scan.
+        contents = self._contents[source][1]
+        path = self._table[entry >> SOURCE_BITS]
+        
+        if self._contents[source][0].shuffle:
+            get_key = self._shuffle_state.ranker(self._contents[source][0].path)
+            ranges = ((0, self._cursors[source]), (self._cursors[source], len(contents)))
+        else:
+            get_key = None
+            ranges = ((0, len(contents)),)
+        
+        key = get_key(path) if get_key else path
+        
+        for lo, hi in ranges:
+            index = self._bisect(contents, key, get_key, lo, hi)
+            
+            while index > lo:
+                index -= 1
+                
+                if contents[index] == entry:
+                    return index
+                
+                found = self._table[contents[index] >> SOURCE_BITS]
+                
+                if (get_key(found) if get_key else found) != key:
+                    break
+        
+        return contents.index(entry)
+    
+    def _bisect(self, contents, key, get_key=None, lo=0, hi=None):
+        # Where key should be inserted into the contents sorted by get_key
+        # of their paths (by the paths themselves by default)
+        hi = len(contents) if hi is None else hi
+        
+        while lo < hi:
+            mid = (lo + hi) // 2
+            path = self._table[contents[mid] >> SOURCE_BITS]
+            
+            if key < (get_key(path) if get_key else path):
+                hi = mid
+            else:
+                lo = mid + 1
+        
+        return lo
+    
+    def restore_position(self, current, hint):
+        self._items = self.mix(self._contents)
+        
+        # The current item may occur more than once, pick the closest occurrence
+        position = None
+        
+        if current is not None and current in self._present:
+            source = current & SOURCE_MASK
+            
+            if self._contents[source][0].shuffle:
+                # Any turn of the source is as good, keep the one it was played at
+                position = hint
+            else:
+                position = self._items.find(source, self._index(source, current), hint)
+        
+        if position is not None:
+            self._position = position + 1
+        else:
+            # Whatever took the place of the current item goes next
+            self._current = None
+            self._position = max(hint, 0)
@@ -0,0 +1,137 @@
+import os, sys, logging, threading
+
+from urllib.parse import urlsplit, unquote
+from xml.etree import ElementTree
+
+# Playlists that include playlists are expanded up to this depth
+MAX_DEPTH = 4
+
+
+class PlaylistFileError(Exception):
+    pass
+
+
+def is_url(location):
+    # Windows drive letters look like one-letter schemes
+    return len(urlsplit(location).scheme) > 1
+
+
+def resolve_location(location, base_dir, quoted=False):
+    """Turns a playlist entry into an absolute path, or leaves a URL as it is.
+    
+    file:// URLs become paths. Relative paths are relative to the
+    directory of the playlist; in XSPF they are URL-encoded (``quoted``).
+    """
+    parts = urlsplit(location)
+    
+    if parts.scheme == 'file':
+        path = unquote(parts.path)
+        
+        if sys.platform == 'win32' and path[:1] == '/' and path[2:3] == ':':
+            path = path[1:]  # /C:/Videos
+        
+        return os.path.normpath(path)
+    
+    if is_url(location):
+        return location
+    
+    if quoted:
+        location = unquote(location)
+    
+    return os.path.normpath(os.path.join(base_dir, os.path.expanduser(location)))
+
+
+def parse_m3u(path):
+    base_dir = os.path.dirname(path)
+    
+    with open(path, 'r', encoding='utf-8-sig', errors='surrogateescape') as f:
+        for line in f:
+            line = line.strip()
+            
+            if line and not line.startswith('#'):
+                yield resolve_location(line, base_dir)
+
+
+def parse_xspf(path):
+    base_dir = os.path.dirname(path)
+    
+    try:
+        root = ElementTree.parse(path).getroot()
+    except ElementTree.ParseError as e:
+        raise PlaylistFileError(str(e)) from e
+    
+    # Tags are {http://xspf.org/ns/0/}track etc., some files have no namespace
+    for element in root.iter():
+        if element.tag.rpartition('}')[2] != 'track':
+            continue
+        
+        for child in element:
+            if child.tag.rpartition('}')[2] == 'location' and (child.text or '').strip():
+                yield resolve_location(child.text.strip(), base_dir, quoted=True)
+                break
+
+
+PARSERS = {
+    '.m3u': parse_m3u,
+    '.m3u8': parse_m3u,
+    '.xspf': parse_xspf
+}
+
+
+class PlaylistFileCache:
+    """Parsed .m3u and .xspf files, kept until their mtime or size changes.
+    
+    ``expand`` flattens a playlist into the files and URLs it lists,
+    expanding the playlists it includes and dropping the local files
+    that don't exist.
+    """
+    
+    def __init__(self):
+        self._files = {}
+        self._lock = threading.Lock()
+    
+    def parse(self, path):
+        parser = PARSERS.get(os.path.splitext(path)[1].lower())
+        
+        if parser is None:
+            raise PlaylistFileError('Unsupported playlist format.')
+        
+        try:
+            st = os.stat(path)
+            key = (st.st_mtime_ns, st.st_size)
+            cached = self._files.get(path)
+            
+            if cached and cached[0] == key:
+                return cached[1]
+            
+            entries = tuple(parser(path))
+        except (OSError, UnicodeError) as e:
+            raise PlaylistFileError(str(e)) from e
+        
+        with self._lock:
+            self._files[path] = (key, entries)
+        
+        return entries
+    
+    def expand(self, path, playlist_extensions=tuple(PARSERS), depth=0):
+        for entry in self.parse(path):
+            if is_url(entry):
+                yield entry
+            elif entry.lower().endswith(playlist_extensions):
+                if depth >= MAX_DEPTH:
+                    logging.warning('Skipping: %s (reason: nested too deep in %s).' % (entry, path))
+                    continue
+                
+                try:
+                    yield from self.expand(entry, playlist_extensions, depth + 1)
+                except PlaylistFileError as e:
+                    logging.warning('Skipping: %s (reason: %s).' % (entry, e))
+            elif os.path.isfile(entry):
+                yield entry
+            else:
+                logging.warning('Skipping: %s (reason: missing, listed in %s).' % (entry, path))
+    
+    def fingerprint(self):
+        # The mtimes of the parsed files, in the format of ScanCache.fingerprint
+        with self._lock:
+            return {path: key[0] for path, (key, entries) in self._files.items()}
@@ -0,0 +1,119 @@
+import os, time, logging, threading
+
+from collections import OrderedDict
+
+import metrics
+
+from playlistfiles import is_url
+
+PREFETCHED_BYTES = metrics.counter(
+    'vlcscheduler_prefetched_bytes_total', 'Bytes of upcoming items read ahead of time.'
+)
+PREFETCH_SECONDS = metrics.histogram(
+    'vlcscheduler_prefetch_seconds', 'Time spent reading an upcoming item ahead of time.'
+)
+
+
+class Prefetcher:
+    """Reads the upcoming items into the page cache before VLC opens them.
+    
+    ``prefetch`` only records the paths, a background thread does the
+    work: it hints the kernel with posix_fadvise where there is one and
+    reads the first ``budget`` bytes of the file (all of it if 0), at most
+    ``rate`` bytes per second so that it doesn't take the bandwidth of the
+    item that is playing. Files that haven't changed since they were last
+    read are skipped.
+    """
+    
+    def __init__(self, budget=67108864, rate=16777216, chunk_size=1048576,
+                 max_pending=4, remember=64):
+        self.budget = budget
+        self.rate = rate
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending
+        self.remember = remember
+        self._pending = OrderedDict()
+        self._warmed = OrderedDict()  # path -> (mtime, size)
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+    
+    def prefetch(self, *paths):
+        # Never blocks: even a stat() can take long on a network mount
+        with self._condition:
+            for path in paths:
+                if path and not is_url(path):
+                    self._pending.pop(path, None)
+                    self._pending[path] = None
+            
+            while len(self._pending) > self.max_pending:
+                self._pending.popitem(last=False)  # no longer upcoming
+            
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='prefetch', daemon=True
+                )
+                self._thread.start()
+            
+            self._condition.notify()
+    
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+    
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+                
+                if self._stopped:
+                    return
+                
+                path, _ = self._pending.popitem(last=False)
+            
+            try:
+                self.warm(path)
+            except OSError as e:
+                logging.debug('Cannot prefetch %s: %s' % (path, e))
+    
+    def warm(self, path):
+        st = os.stat(path)
+        key = (st.st_mtime_ns, st.st_size)
+        
+        if self._warmed.get(path) == key:
+            return
+        
+        length = min(self.budget, st.st_size) if self.budget else st.st_size
+        started = time.monotonic()
+        done = 0
+        
+        with open(path, 'rb', buffering=0) as f:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(f.fileno(), 0, length, os.POSIX_FADV_WILLNEED)
+            
+            while done < length and not self._stopped:
+                chunk = f.read(min(self.chunk_size, length - done))
+                
+                if not chunk:
+                    break
+                
+                done += len(chunk)
+                
+                if self.rate:
+                    # Sleep off whatever is ahead of the allowed rate
+                    ahead = done / self.rate - (time.monotonic() - started)
+                    
+                    if ahead > 0:
+                        time.sleep(ahead)
+        
+        PREFETCHED_BYTES.inc(done)
+        PREFETCH_SECONDS.observe(time.monotonic() - started)
+        logging.debug('Prefetched %i bytes of %s.' % (done, path))
+        
+        self._warmed.pop(path, None)
+        self._warmed[path] = key
+        
+        while len(self._warmed) > self.remember:
+            self._warmed.popitem(last=False)
@@ -0,0 +1,84 @@
+import queue, logging
+
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+import metrics
+
+# The full listings of the builds; the main log only gets a summary
+logger = logging.getLogger('vlcscheduler.report')
+logger.propagate = False
+logger.setLevel(logging.CRITICAL)  # nothing is recorded until start() is called
+
+DROPPED = metrics.counter(
+    'vlcscheduler_report_dropped_total', 'Report records dropped because the queue was full.'
+)
+
+
+class Listing:
+    """The message of a report record: a title and the lines under it.
+    
+    ``lines`` is a function, called only when the record is written by the
+    listener thread, so building the message costs nothing to the caller.
+    """
+    
+    def __init__(self, title, lines):
+        self.title = title
+        self.lines = lines
+    
+    def __str__(self):
+        return self.title + ''.join('\n\t' + line for line in self.lines())
+
+
+class ReportHandler(QueueHandler):
+    # Hands the records over as they are (QueueHandler would format them here)
+    # and drops them rather than wait when the listener is behind
+    def prepare(self, record):
+        return record
+    
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED.inc()
+
+
+def start(path, max_bytes=10485760, backup_count=3, queue_size=100):
+    """Writes the report to a rotating file from a background thread.
+    
+    Returns the listener, to be stopped on exit, or None if there's no path.
+    """
+    if not path:
+        return None
+    
+    file_handler = RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True
+    )
+    file_handler.setFormatter(logging.Formatter('%(asctime)s %(message)s', '[%Y-%m-%d %H:%M:%S]'))
+    
+    records = queue.Queue(maxsize=queue_size)
+    listener = QueueListener(records, file_handler)
+    
+    logger.handlers = [ReportHandler(records)]
+    logger.setLevel(logging.INFO)
+    listener.start()
+    
+    return listener
+
+
+def stop(listener):
+    # Writes out the queued records
+    if listener:
+        logger.setLevel(logging.CRITICAL)
+        listener.stop()
+        
+        for handler in listener.handlers:
+            handler.close()
+
+
+def is_enabled():
+    return logger.isEnabledFor(logging.INFO)
+
+
+def listing(title, lines):
+    if is_enabled():
+        logger.info(Listing(title, lines))
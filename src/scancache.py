@@ -0,0 +1,95 @@
+import os, time, pickle, logging, threading
+
+import utils
+
+# Listings of directories modified less than this many seconds before the
+# scan are not trusted: coarse mtime resolution (FAT, SMB) could hide a change
+RACY_INTERVAL = 2
+
+
+class ScanCache:
+    """Remembers directory listings together with the directories' mtimes.
+    
+    A directory whose mtime hasn't changed since it was last listed still
+    has the same entries, so it is only stat()-ed instead of being read
+    with os.scandir again. With ``path`` set, the listings are kept across
+    restarts.
+    """
+    
+    def __init__(self, path=None):
+        self.path = path
+        self._dirs = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        
+        if path and os.path.isfile(path):
+            try:
+                with open(path, 'rb') as f:
+                    self._dirs = pickle.load(f)
+            except Exception as e:
+                logging.warning('Ignoring the scan cache %s: %s' % (path, e))
+    
+    def listdir(self, path):
+        # Returns the names of the files and of the subdirectories in path
+        st = os.stat(path)
+        cached = self._dirs.get(path)
+        
+        if cached and cached[0] == st.st_mtime_ns:
+            return cached[1], cached[2]
+        
+        files, dirs = [], []
+        
+        for entry in os.scandir(path):
+            if entry.is_file():
+                files.append(entry.name)
+            elif entry.is_dir():
+                dirs.append(entry.name)
+        
+        files, dirs = tuple(sorted(files)), tuple(sorted(dirs))
+        
+        if time.time() - st.st_mtime > RACY_INTERVAL:
+            mtime = st.st_mtime_ns
+        else:
+            mtime = None
+        
+        with self._lock:
+            if cached:
+                for name in set(cached[2]) - set(dirs):
+                    self._forget(os.path.join(path, name))
+            
+            self._dirs[path] = (mtime, files, dirs)
+            self._dirty = True
+        
+        return files, dirs
+    
+    def fingerprint(self, path, recursive=False):
+        # The mtimes of path (and of its subdirectories) as they were last listed;
+        # None for directories that haven't been listed or changed while listed
+        mtimes = {}
+        pending = [path]
+        
+        while pending:
+            directory = pending.pop()
+            cached = self._dirs.get(directory)
+            mtimes[directory] = cached and cached[0]
+            
+            if cached and recursive:
+                pending.extend(os.path.join(directory, name) for name in cached[2])
+        
+        return mtimes
+    
+    def _forget(self, path):
+        prefix = path + os.sep
+        
+        for key in [k for k in self._dirs if k == path or k.startswith(prefix)]:
+            del self._dirs[key]
+    
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        
+        with self._lock:
+            data = pickle.dumps(self._dirs, protocol=pickle.HIGHEST_PROTOCOL)
+            self._dirty = False
+        
+        utils.atomic_write(self.path, data, 'the scan cache')
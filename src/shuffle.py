@@ -0,0 +1,177 @@
+import os, json, time, base64, random, bisect, hashlib, logging, threading
+
+from array import array
+
+import utils
+
+
+class ShuffleState:
+    """Seeds and progress of the shuffled sources, kept across rebuilds and restarts.
+    
+    In every cycle a shuffled source plays its files in the order of their
+    ranks: keyed hashes of their paths, seeded with the source's seed and
+    the number of the cycle (epoch), so the next cycle gets a new order.
+    The progress is the set of the files played in the current cycle, kept
+    as the top 32 bits of their ranks, so it holds however many files are
+    added or removed in between: new files are played in the rest of the
+    cycle, in the order of their ranks, and played ones aren't played again.
+    With ``path`` set, the state is saved as JSON at most every
+    ``save_interval`` seconds.
+    """
+    
+    def __init__(self, path=None, save_interval=10):
+        self.path = path
+        self.save_interval = save_interval
+        self._sources = {}
+        self._played = {}  # key -> sorted array('I') of the played files, decoded when needed
+        self._dirty = False
+        self._saved = 0
+        self._lock = threading.Lock()
+        
+        if path and os.path.isfile(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._sources = json.load(f)
+            except Exception as e:
+                logging.warning('Ignoring the shuffle state %s: %s' % (path, e))
+    
+    def _get(self, key):
+        state = self._sources.get(key)
+        
+        if state is None or 'played' not in state:
+            # New, or saved by a version that counted the played files instead
+            state = self._sources[key] = {
+                'seed': random.getrandbits(64), 'epoch': 0, 'played': ''
+            }
+            self._dirty = True
+        
+        return state
+    
+    def _get_played(self, key):
+        played = self._played.get(key)
+        
+        if played is None:
+            played = self._played[key] = array('I')
+            played.frombytes(base64.b64decode(self._get(key)['played']))
+        
+        return played
+    
+    def ranker(self, key, epoch=None):
+        # A function that returns the rank of a path in the current cycle or
+        # in the given one. It may be called from any thread.
+        with self._lock:
+            state = self._get(key)
+            salt = '%d:%d' % (state['seed'], state['epoch'] if epoch is None else epoch)
+        
+        salt = salt.encode('ascii')
+        
+        def rank(path):
+            digest = hashlib.blake2b(
+                path.encode('utf-8', 'surrogateescape'), digest_size=8, key=salt
+            ).digest()
+            return int.from_bytes(digest, 'big')
+        
+        return rank
+    
+    def epoch(self, key):
+        with self._lock:
+            return self._get(key)['epoch']
+    
+    def order(self, key, paths):
+        # The paths in the order of the current cycle, the played ones first,
+        # and how many of them have been played in it
+        rank = self.ranker(key)
+        ranked = sorted((rank(path), path) for path in paths)
+        
+        with self._lock:
+            played = self._get_played(key)
+            done = [self._contains(played, r) for r, path in ranked]
+        
+        ordered = [path for (r, path), d in zip(ranked, done) if d]
+        count = len(ordered)
+        ordered += [path for (r, path), d in zip(ranked, done) if not d]
+        
+        return ordered, count
+    
+    @staticmethod
+    def _contains(played, rank):
+        i = bisect.bisect_left(played, rank >> 32)
+        return i < len(played) and played[i] == rank >> 32
+    
+    def was_played(self, key, rank):
+        with self._lock:
+            return self._contains(self._get_played(key), rank)
+    
+    def played(self, key, rank):
+        # Called when the file with the given rank has been played
+        with self._lock:
+            played = self._get_played(key)
+            
+            if not self._contains(played, rank):
+                played.insert(bisect.bisect_left(played, rank >> 32), rank >> 32)
+                self._dirty = True
+        
+        self._save_later()
+    
+    def new_cycle(self, key):
+        # Starts the next cycle, in a new order. Returns its epoch.
+        with self._lock:
+            state = self._get(key)
+            state['epoch'] += 1
+            self._played[key] = array('I')
+            self._dirty = True
+            epoch = state['epoch']
+        
+        self._save_later()
+        return epoch
+    
+    def _save_later(self):
+        if time.monotonic() - self._saved >= self.save_interval:
+            self.save()
+    
+    def scoped(self, prefix):
+        # A view for one output, so that outputs sharing a source don't share its progress
+        return ScopedShuffleState(self, prefix) if prefix else self
+    
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        
+        with self._lock:
+            for key, played in self._played.items():
+                self._sources[key]['played'] = base64.b64encode(played.tobytes()).decode('ascii')
+            
+            data = json.dumps(self._sources, indent=1, sort_keys=True)
+            self._dirty = False
+            self._saved = time.monotonic()
+        
+        utils.atomic_write(self.path, data, 'the shuffle state')
+
+
+class ScopedShuffleState:
+    """Prefixes the keys of a ShuffleState; saving saves the whole state."""
+    
+    def __init__(self, state, prefix):
+        self.state = state
+        self.prefix = prefix
+    
+    def ranker(self, key, epoch=None):
+        return self.state.ranker(self.prefix + key, epoch)
+    
+    def epoch(self, key):
+        return self.state.epoch(self.prefix + key)
+    
+    def order(self, key, paths):
+        return self.state.order(self.prefix + key, paths)
+    
+    def was_played(self, key, rank):
+        return self.state.was_played(self.prefix + key, rank)
+    
+    def played(self, key, rank):
+        return self.state.played(self.prefix + key, rank)
+    
+    def new_cycle(self, key):
+        return self.state.new_cycle(self.prefix + key)
+    
+    def save(self):
+        self.state.save()
@@ -0,0 +1,123 @@
+import os, time, pickle, asyncio, hashlib, logging
+
+import utils
+
+# Bumped whenever the layout of the saved state changes
+FORMAT = 4
+
+
+class Snapshot:
+    """Saves the built playlists and the playout state of all outputs.
+    
+    Together with the state, the mtimes of the source directories (and
+    of the playlist files) are saved as they were last read. ``load`` returns the state
+    only if it was saved with the same ``key`` (the configuration) and
+    none of these directories has changed since, so a restart can resume
+    playout without reading the sources. ``run`` saves atomically, at
+    most every ``interval`` seconds and only if something has changed.
+    """
+    
+    def __init__(self, outputs, path=None, interval=10, key='', scan_cache=None,
+                 shuffle_state=None, playlist_files=None, wall_time=time.time):
+        self.outputs = outputs
+        self.path = path
+        self.interval = interval
+        self.key = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        self.scan_cache = scan_cache
+        self.shuffle_state = shuffle_state
+        self.playlist_files = playlist_files
+        self.wall_time = wall_time
+        self._revision = None
+    
+    def load(self):
+        if not self.path or not os.path.isfile(self.path):
+            return None
+        
+        try:
+            with open(self.path, 'rb') as f:
+                data = pickle.load(f)
+        except Exception as e:
+            logging.warning('Ignoring the snapshot %s: %s' % (self.path, e))
+            return None
+        
+        if data.get('format') != FORMAT or data.get('key') != self.key:
+            logging.info('The snapshot was saved with another configuration.')
+            return None
+        
+        for directory, mtime in data['fingerprint'].items():
+            try:
+                current = os.stat(directory).st_mtime_ns
+            except OSError:
+                current = None
+            
+            if mtime is None or current != mtime:
+                logging.info('%s has changed since the snapshot was saved.' % directory)
+                return None
+        
+        return data
+    
+    def get_revision(self):
+        return tuple(output.get_revision() for output in self.outputs)
+    
+    def get_fingerprint(self):
+        fingerprint = {}
+        
+        for output in self.outputs:
+            for path, recursive in output.get_built_paths():
+                if self.scan_cache:
+                    fingerprint.update(self.scan_cache.fingerprint(path, recursive))
+                else:
+                    fingerprint[path] = None
+        
+        if self.playlist_files:
+            # Playlist files can change without changing their directory
+            fingerprint.update(self.playlist_files.fingerprint())
+        
+        return fingerprint
+    
+    def capture(self):
+        # Must be called from the event loop, which owns the queues and the timers
+        return {
+            'format': FORMAT,
+            'key': self.key,
+            'time': self.wall_time(),
+            'fingerprint': self.get_fingerprint(),
+            'outputs': [output.get_state() for output in self.outputs]
+        }
+    
+    def save(self, data):
+        utils.atomic_write(
+            self.path, pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL), 'the snapshot'
+        )
+        
+        if self.shuffle_state:
+            self.shuffle_state.save()
+    
+    def _capture_if_changed(self):
+        revision = self.get_revision()
+        
+        if revision == self._revision:
+            return None
+        
+        self._revision = revision
+        return self.capture()
+    
+    async def run(self):
+        if not self.path:
+            return
+        
+        loop = asyncio.get_event_loop()
+        
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                data = self._capture_if_changed()
+                
+                if data:
+                    await loop.run_in_executor(None, self.save, data)
+        finally:
+            # Stopping: save what has happened since the last save
+            data = self._capture_if_changed()
+            
+            if data:
+                self.save(data)
@@ -0,0 +1,64 @@
+import bisect, datetime
+
+import utils
+
+
+def time_to_seconds(t):
+    return t.hour * 3600 + t.minute * 60 + t.second + t.microsecond / 1e6
+
+
+def seconds_to_time(s):
+    s = s % 86400
+    return datetime.time(int(s // 3600), int(s % 3600 // 60), int(s % 60), int(s % 1 * 1e6))
+
+
+class Timeline:
+    """Daily playing time windows compiled into a sorted index.
+    
+    ``windows`` is a list of (key, start_time, end_time) tuples; windows
+    that cross midnight are fine. Both ends of a window are inclusive, just
+    like in utils.is_time_within_interval. After compiling, ``active_at``
+    and ``next_boundary`` take O(log n).
+    """
+    
+    def __init__(self, windows):
+        self.boundaries = sorted(set(t for key, start, end in windows for t in (start, end)))
+        self._seconds = [time_to_seconds(t) for t in self.boundaries]
+        
+        # What is active exactly at each boundary and in the gap that follows it
+        self._at = []
+        self._after = []
+        
+        for i, seconds in enumerate(self._seconds):
+            if i + 1 < len(self._seconds):
+                middle = (seconds + self._seconds[i + 1]) / 2
+            else:  # the gap that wraps around midnight
+                middle = (seconds + self._seconds[0] + 86400) / 2
+            
+            self._at.append(self._active(windows, self.boundaries[i]))
+            self._after.append(self._active(windows, seconds_to_time(middle)))
+    
+    def _active(self, windows, t):
+        return frozenset(
+            key for key, start, end in windows if utils.is_time_within_interval(t, start, end)
+        )
+    
+    def active_at(self, t):
+        if not self.boundaries:
+            return frozenset()
+        
+        i = bisect.bisect_left(self.boundaries, t)
+        
+        if i < len(self.boundaries) and self.boundaries[i] == t:
+            return self._at[i]
+        
+        return self._after[i - 1]  # i == 0 wraps around to the last gap
+    
+    def next_boundary(self, t):
+        # The first boundary after t, possibly on the next day
+        if not self.boundaries:
+            return None
+        
+        i = bisect.bisect_right(self.boundaries, t)
+        
+        return self.boundaries[i % len(self.boundaries)]
@@ -0,0 +1,167 @@
+import asyncio, datetime, heapq, itertools, logging, time
+
+
+class Job:
+    __slots__ = ('due', 'seq', 'callback', 'interval', 'at', 'tag', 'cancelled')
+    
+    def __init__(self, due, seq, callback, interval=None, at=None, tag=None):
+        self.due = due
+        self.seq = seq
+        self.callback = callback
+        self.interval = interval
+        self.at = at
+        self.tag = tag
+        self.cancelled = False
+    
+    def __lt__(self, other):
+        return (self.due, self.seq) < (other.due, other.seq)
+
+
+class TimerScheduler:
+    """Runs periodic and daily jobs from heaps with a single loop.call_at().
+    
+    Interval jobs are timed with the loop's monotonic clock, daily jobs
+    with the wall clock, so that DST changes and clock adjustments move
+    them as expected. The loop only wakes up when a job is due, or every
+    ``max_sleep`` seconds while there are daily jobs, to notice if the
+    wall clock has jumped.
+    """
+    
+    def __init__(self, loop=None, wall_time=time.time, max_sleep=60):
+        self.loop = loop or asyncio.get_event_loop()
+        self.wall_time = wall_time
+        self.max_sleep = max_sleep
+        self._interval_jobs = []
+        self._daily_jobs = []
+        self._tags = {}
+        self._cancelled = 0
+        self._seq = itertools.count()
+        self._handle = None
+    
+    def _next_daily(self, at):
+        now = self.wall_time()
+        today = datetime.datetime.fromtimestamp(now).date()
+        
+        for days in (0, 1, 2):
+            # Naive local datetimes take DST into account in timestamp()
+            due = datetime.datetime.combine(today + datetime.timedelta(days=days), at).timestamp()
+            
+            if due > now:
+                return due
+    
+    def _add(self, heap, job):
+        heapq.heappush(heap, job)
+        
+        if job.tag is not None:
+            self._tags.setdefault(job.tag, set()).add(job)
+        
+        self._arm()
+        return job
+    
+    def every(self, seconds, callback, tag=None, delay=None):
+        # The first run is after delay seconds, if given
+        due = self.loop.time() + (seconds if delay is None else delay)
+        job = Job(due, next(self._seq), callback, interval=seconds, tag=tag)
+        return self._add(self._interval_jobs, job)
+    
+    def daily_at(self, at, callback, tag=None):
+        job = Job(self._next_daily(at), next(self._seq), callback, at=at, tag=tag)
+        return self._add(self._daily_jobs, job)
+    
+    def cancel(self, job):
+        if job.cancelled:
+            return
+        
+        job.cancelled = True
+        self._cancelled += 1
+        
+        if job.tag is not None:
+            self._tags.get(job.tag, set()).discard(job)
+        
+        # Cancelled jobs stay in the heaps until they come up or pile up
+        if self._cancelled > (len(self._interval_jobs) + len(self._daily_jobs)) // 2:
+            self._compact()
+    
+    def clear(self, tag=None):
+        if tag is None:
+            jobs = self._interval_jobs + self._daily_jobs
+        else:
+            jobs = list(self._tags.get(tag, ()))
+        
+        for job in jobs:
+            self.cancel(job)
+        
+        self._arm()
+    
+    def _compact(self):
+        for heap in (self._interval_jobs, self._daily_jobs):
+            heap[:] = [job for job in heap if not job.cancelled]
+            heapq.heapify(heap)
+        
+        self._cancelled = 0
+    
+    def _top(self, heap):
+        while heap and heap[0].cancelled:
+            heapq.heappop(heap)
+            self._cancelled -= 1
+        
+        return heap[0] if heap else None
+    
+    def _arm(self):
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+        
+        delays = []
+        interval_job = self._top(self._interval_jobs)
+        daily_job = self._top(self._daily_jobs)
+        
+        if interval_job:
+            delays.append(interval_job.due - self.loop.time())
+        
+        if daily_job:
+            delays.append(min(daily_job.due - self.wall_time(), self.max_sleep))
+        
+        if delays:
+            self._handle = self.loop.call_at(self.loop.time() + max(min(delays), 0), self._run)
+    
+    def _call(self, job):
+        try:
+            job.callback()
+        except Exception:
+            logging.exception('Scheduled job %r failed.' % job.callback)
+    
+    def _run(self):
+        self._handle = None
+        due = []
+        
+        for heap, now in ((self._interval_jobs, self.loop.time()),
+                          (self._daily_jobs, self.wall_time())):
+            while self._top(heap) and heap[0].due <= now:
+                due.append((heap, heapq.heappop(heap)))
+        
+        for heap, job in due:
+            if not job.cancelled:
+                self._call(job)
+            
+            if job.cancelled:  # possibly by a callback that has just run
+                self._cancelled = max(self._cancelled - 1, 0)
+                continue
+            
+            if job.interval is not None:
+                job.due += job.interval
+                
+                if job.due <= self.loop.time():
+                    # Don't try to catch up on runs missed while the loop was busy
+                    job.due = self.loop.time() + job.interval
+            else:
+                job.due = self._next_daily(job.at)
+            
+            heapq.heappush(heap, job)
+        
+        self._arm()
+    
+    def get_jobs(self, tag=None):
+        jobs = self._interval_jobs + self._daily_jobs
+        
+        return [job for job in jobs if not job.cancelled and (tag is None or job.tag == tag)]
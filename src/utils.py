@@ -1,11 +1,13 @@
-import os, re
-
-from itertools import cycle, islice, chain, filterfalse
+import os, re, logging
 
 TIME_INTERVAL_REGEX = re.compile('(\d\d:\d\d).?-.?(\d\d:\d\d)')
 
 
-def list_files_with_extensions(path, extensions, recursive=False):
+def list_files_with_extensions(path, extensions, recursive=False, cache=None):
+    if cache is not None:
+        yield from list_cached_files_with_extensions(path, extensions, recursive, cache)
+        return
+    
     for entry in os.scandir(path):
         if entry.name.lower().endswith(extensions) and entry.is_file():
             yield entry.path
@@ -13,20 +15,18 @@ def list_files_with_extensions(path, extensions, recursive=False):
             yield from list_files_with_extensions(entry.path, extensions, recursive)
 
 
-def zip_equally(*iterables):
-    # ['A1'], ['B1', 'B2', 'B3'], ['C1', 'C2'] ->
-    # -> 'A1', 'B1', 'C1', 'A1', 'B2', 'C2', 'A1', 'B3', 'C1'
-    if len(iterables) == 0:
-        return []
+def list_cached_files_with_extensions(path, extensions, recursive, cache):
+    files, dirs = cache.listdir(path)
     
-    longest_iterable_length = len(max(iterables, key=len))
+    for name in files:
+        if name.lower().endswith(extensions):
+            yield os.path.join(path, name)
     
-    iterables = [
-        islice(cycle(l), longest_iterable_length) for l
-        in filterfalse(lambda i: len(i) == 0, iterables)
-    ]
-    
-    return chain(*[i for i in zip(*iterables)])
+    if recursive is True:
+        for name in dirs:
+            yield from list_cached_files_with_extensions(
+                os.path.join(path, name), extensions, recursive, cache
+            )
 
 
 def parse_time_interval(string):
@@ -38,6 +38,29 @@ def parse_time_interval(string):
     return match[1], match[2]
 
 
+def atomic_write(path, data, description):
+    # Writes data (str or bytes) to a temporary file and moves it over path, so
+    # that path is never left half-written. Returns False, after logging why
+    # (e.g. 'Cannot save the scan cache ...'), if it couldn't be written.
+    tmp_path = path + '.tmp'
+    
+    try:
+        if isinstance(data, str):
+            f = open(tmp_path, 'w', encoding='utf-8')
+        else:
+            f = open(tmp_path, 'wb')
+        
+        with f:
+            f.write(data)
+        
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.warning('Cannot save %s %s: %s' % (description, path, e))
+        return False
+    
+    return True
+
+
 def is_time_within_interval(ref_time, start_time, end_time):
     if start_time < end_time:
         return ref_time >= start_time and ref_time <= end_time
@@ -1,8 +1,16 @@
-import logging, time, asyncio
+import logging, asyncio
 
-import requests
 from urllib.parse import urljoin
 
+import httpclient, metrics
+
+REQUEST_SECONDS = metrics.histogram(
+    'vlcscheduler_vlc_request_seconds', 'Time spent on HTTP requests to VLC.', ['request']
+)
+REQUEST_ERRORS = metrics.counter(
+    'vlcscheduler_vlc_request_errors_total', 'HTTP requests to VLC that failed.', ['request']
+)
+
 
 class VLCError(Exception):
     pass
@@ -16,6 +24,15 @@ class VLCExitError(VLCError):
     pass
 
 
+def iter_playlist_items(node):
+    # Walks the tree returned by requests/playlist.json
+    if node.get('type') == 'leaf':
+        yield node
+    
+    for child in node.get('children', []):
+        yield from iter_playlist_items(child)
+
+
 class VLCLauncher:
     def __init__(self, config, debug=False):
         self.config = config
@@ -23,29 +40,38 @@ class VLCLauncher:
         self.base_url = 'http://' + config['host'] + ':' + str(config['port'])
         self.process = None
     
-    def check_connection(self, retries=0):
-        for i in range(retries, -1, -1):
-            try:
-                resp = requests.get(self.base_url, timeout=5)
-            except requests.exceptions.RequestException as e:
-                if i > 0:
-                    logging.warning(
-                        'Connection attempt failed because of: %s. Retry in 3 seconds.' % str(e)
-                    )
-                    time.sleep(3)
-                    continue
-            else:
-                if 'VideoLAN' in resp.text:
-                    return True
+    async def check_connection(self, timeout=1):
+        # True if VLC's web interface answers
+        try:
+            resp = await httpclient.get(self.base_url, timeout=timeout)
+        except httpclient.HTTPError:
+            return False
         
-        raise VLCConnectionError('Failed to connect to the VLC web server.')
+        return 'VideoLAN' in resp.text
+    
+    async def wait_until_ready(self, timeout=10, delay=0.005, max_delay=0.5):
+        # Polls the web interface, waiting twice as long after every failed attempt
+        loop = asyncio.get_event_loop()
+        started = loop.time()
+        attempts = 1
+        
+        while not await self.check_connection():
+            if self.process and self.process.returncode is not None:
+                raise VLCExitError('VLC was closed.')
+            
+            if loop.time() - started >= timeout:
+                raise VLCConnectionError('Failed to connect to the VLC web server.')
+            
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+            attempts += 1
+        
+        logging.debug('VLC has answered after %i attempt(s) in %.3f seconds.' % (
+            attempts, loop.time() - started
+        ))
     
     async def launch(self):
-        try:
-            self.check_connection()
-        except VLCConnectionError:
-            pass
-        else:
+        if await self.check_connection():
             logging.warning('Found existing VLC instance.')
             return
         
@@ -69,8 +95,7 @@ class VLCLauncher:
             kwargs['stdout'] = asyncio.subprocess.DEVNULL
         
         self.process = await asyncio.create_subprocess_exec(*command, **kwargs)
-        time.sleep(1)
-        self.check_connection(3)
+        await self.wait_until_ready(self.config.get('startup_timeout', 10))
         return self.process
     
     async def watch_exit(self):
@@ -83,69 +108,98 @@ class VLCLauncher:
 
 class VLCHTTPClient:
     def __init__(self, config, ping_urls=None):
-        self.session = requests.session()
         self.base_url = 'http://' + config['host'] + ':' + str(config['port'])
-        self.session.auth = ('', config['password'])
+        self.auth = ('', config['password'])
+        self.timeout = config.get('timeout', 5)
         self.ping_urls = ping_urls
 
-    def _request(self, path, **kwargs):
-        resp = self.session.get(urljoin(self.base_url, path), **kwargs)
+    async def _request(self, path, params=None, timeout=None, name=None):
+        name = name or path.rpartition('/')[2]
         
-        if resp.status_code != requests.codes.ok:
+        try:
+            with REQUEST_SECONDS.time(request=name):
+                resp = await httpclient.get(
+                    urljoin(self.base_url, path), params=params, auth=self.auth,
+                    timeout=timeout or self.timeout
+                )
+            
             resp.raise_for_status()
-        
-        self.session.close()  # VLC doesn't support keep-alive
+        except httpclient.HTTPError as e:
+            REQUEST_ERRORS.inc(request=name)
+            raise VLCConnectionError(str(e)) from e
         
         return resp
     
-    def _command(self, command, params={}):
+    async def _request_json(self, path, timeout=None):
+        resp = await self._request(path, timeout=timeout)
+        
+        try:
+            data = resp.json()
+        except ValueError as e:
+            data = e
+        
+        if not isinstance(data, dict):
+            REQUEST_ERRORS.inc(request=path.rpartition('/')[2])
+            raise VLCConnectionError('Malformed response from %s.' % resp.url)
+        
+        return data
+    
+    async def _command(self, command, params={}, timeout=None):
         # VLC doesn't support urlencoded parameters
         # https://forum.videolan.org/viewtopic.php?f=16&t=145695
         params = ('command=' + command + '&' +
                   '&'.join('%s=%s' % (k, v) for k, v in params.items()))
 
-        return self._request('requests/status.xml', params=params)
+        return await self._request(
+            'requests/status.xml', params=params, timeout=timeout, name=command
+        )
     
     def _format_uri(self, uri):
         # VLC only understands urlencoded =
         return uri.replace('=', '%3D')
     
-    def status(self):
-        return self._request('requests/status.json').json()
+    async def status(self, timeout=None):
+        return await self._request_json('requests/status.json', timeout)
     
-    def add(self, uri):
-        return self._command('in_play', {'input': self._format_uri(uri)})
+    async def playlist(self, timeout=None):
+        return await self._request_json('requests/playlist.json', timeout)
     
-    def enqueue(self, uri):
-        return self._command('in_enqueue', {'input': self._format_uri(uri)})
+    async def add(self, uri, timeout=None):
+        return await self._command('in_play', {'input': self._format_uri(uri)}, timeout)
     
-    def play(self, uid=None):
+    async def enqueue(self, uri, timeout=None):
+        return await self._command('in_enqueue', {'input': self._format_uri(uri)}, timeout)
+    
+    async def play(self, uid=None, timeout=None):
         if uid:
-            return self._command('pl_play', {'id': uid})
+            return await self._command('pl_play', {'id': uid}, timeout)
         else:
-            return self._command('pl_play')
+            return await self._command('pl_play', timeout=timeout)
+    
+    async def pause(self, timeout=None):
+        return await self._command('pl_pause', timeout=timeout)
     
-    def pause(self):
-        return self._command('pl_pause')
+    async def stop(self, timeout=None):
+        return await self._command('pl_stop', timeout=timeout)
     
-    def stop(self):
-        return self._command('pl_stop')
+    async def next(self, timeout=None):
+        return await self._command('pl_next', timeout=timeout)
     
-    def next(self):
-        return self._command('pl_next')
+    async def previous(self, timeout=None):
+        return await self._command('pl_previous', timeout=timeout)
     
-    def previous(self):
-        return self._command('pl_previous')
+    async def empty(self, timeout=None):
+        return await self._command('pl_empty', timeout=timeout)
     
-    def empty(self):
-        return self._command('pl_empty')
+    async def delete(self, uid, timeout=None):
+        return await self._command('pl_delete', {'id': uid}, timeout)
     
-    def toggle_repeat(self):
-        return self._command('pl_repeat')
+    async def toggle_repeat(self, timeout=None):
+        return await self._command('pl_repeat', timeout=timeout)
     
-    def repeat(self, value=None):
+    async def repeat(self, value=None, timeout=None):
         if value is None:
-            return self._command('pl_repeat')
+            return await self._command('pl_repeat', timeout=timeout)
         
-        if self.status()['repeat'] != value:
-            return self._command('pl_repeat')
+        if (await self.status(timeout))['repeat'] != value:
+            return await self._command('pl_repeat', timeout=timeout)
@@ -1,210 +1,616 @@
-import os, sys, asyncio, traceback
+import os, sys, time, asyncio, datetime, traceback
 
-import click, schedule
-from watchgod import awatch
+# The startup phases in the debug log are timed from here, imports included
+STARTED = time.perf_counter()
 
-from config import config, logger
-from watchers import VLCSchedulerSourceWatcher
-from playlist import Playlist
-import version, vlc
+import click
 
-import requests
+from config import config, logger, resolve_path, get_outputs, load as load_config
+from watchers import watch_sources
+from playlist import ADDED, MODIFIED, DELETED
+from outputs import Output, OutputLogger
+from pinger import PingDispatcher
+from durations import DurationCache
+from scancache import ScanCache
+from shuffle import ShuffleState
+from pipeline import RebuildPipeline
+from playlistfiles import PlaylistFileCache, is_url
+from prefetch import Prefetcher
+from mirror import Mirror
+from catalog import DateCatalog
+from snapshot import Snapshot
+from clock import PlayoutClock
+from timers import TimerScheduler
+import version, vlc, metrics, report
 
-async def watchgod_coro(path, action):
-    async for changes in awatch(path, watcher_cls=VLCSchedulerSourceWatcher, debounce=3600):
-        logger.info('Changes detected in %s.' % path)
-        action()
+CHANGE_NAMES = {ADDED: 'added', MODIFIED: 'modified', DELETED: 'deleted'}
 
+# Seconds to wait before asking a stalled or failing VLC again, doubled up to the maximum
+VLC_RETRY_DELAY = 0.5
+VLC_MAX_RETRY_DELAY = 16
 
-async def schedule_coro():
+WATCHER_EVENTS = metrics.counter(
+    'vlcscheduler_watcher_events_total', 'Changes reported by the watcher.', ['change']
+)
+TRANSITION_SECONDS = metrics.histogram(
+    'vlcscheduler_transition_seconds',
+    'Time from the end of an item until VLC has been told to play the next one.', ['output']
+)
+ITEMS_PLAYED = metrics.counter(
+    'vlcscheduler_items_played_total', 'Items started in VLC.', ['output']
+)
+STARTUP_SECONDS = metrics.gauge(
+    'vlcscheduler_startup_seconds', 'Time from the start until each startup phase.', ['phase']
+)
+
+
+def get_allowed_extensions():
+    return tuple(list(config.MEDIA_EXTENSIONS) + list(config.PLAYLIST_EXTENSIONS))
+
+
+def is_playable(path):
+    # URLs from playlist files are left to VLC
+    return is_url(path) or os.path.isfile(path)
+
+
+def is_status_of(status, item_id, location):
+    # VLC takes a moment to switch, until then its status is the previous item's
+    if item_id is not None and 'currentplid' in status:
+        return str(status['currentplid']) == str(item_id)
+    
+    meta = status.get('information', {}).get('category', {}).get('meta', {})
+    return meta.get('filename') == os.path.basename(location)
+
+
+def log_startup(phase, log=logger):
+    elapsed = time.perf_counter() - STARTED
+    STARTUP_SECONDS.set(elapsed, phase=phase)
+    log.debug('Startup: %s after %.3f seconds.' % (phase.replace('_', ' '), elapsed))
+
+
+async def watch_coro(paths, action):
+    changes_iterator = watch_sources(
+        paths, get_allowed_extensions(), debounce=config.WATCHER['debounce'],
+        backend=config.WATCHER['backend']
+    )
+    
+    async for changes in changes_iterator:
+        if changes is None:
+            WATCHER_EVENTS.inc(change='overflow')
+            logger.info('Changes detected in the sources.')
+        else:
+            for change, path in changes:
+                WATCHER_EVENTS.inc(change=CHANGE_NAMES.get(change, change))
+            
+            logger.info('Changes detected in %s.' % ', '.join(sorted(set(
+                os.path.dirname(path) for change, path in changes
+            ))))
+        
+        await action(changes)
+
+
+def drain_queue(queue):
+    while not queue.empty():
+        queue.get_nowait()
+
+
+def take_next_item(playlist, extra_items_queue):
+    # Periodic items go first; raises StopIteration if the playlist is empty
+    try:
+        return extra_items_queue.get_nowait()
+    except asyncio.QueueEmpty:
+        return playlist.get_next()
+
+
+def get_upcoming_paths(playlist, extra_items_queue):
+    # What take_next_item() will return next, unless an ad becomes due first
+    items = extra_items_queue.peek() + [playlist.peek_next()]
+    
+    return [
+        item.location for item in items
+        if item and not item.path.lower().endswith(config.PLAYLIST_EXTENSIONS)
+    ]
+
+
+async def prepare_next_item(player, playlist, extra_items_queue, current_item_path,
+                            durations=None):
+    """Enqueues the item that comes next in VLC while the current one is playing.
+    
+    Returns a tuple of the item, its id in VLC's playlist (None if it hasn't
+    been enqueued), its length if known and the ids of VLC's older entries.
+    """
+    try:
+        item = take_next_item(playlist, extra_items_queue)
+    except StopIteration:
+        return None
+    
+    location = item.location
+    
+    if (item.path == current_item_path or not is_playable(location) or
+            item.path.lower().endswith(config.PLAYLIST_EXTENSIONS)):
+        # Handled when its turn comes
+        return item, None, None, []
+    
+    try:
+        await player.enqueue(location)
+        entries = list(vlc.iter_playlist_items(await player.playlist()))
+    except vlc.VLCError as e:
+        # Added the usual way when its turn comes
+        logger.warning('Cannot enqueue the next item in VLC: %s' % e)
+        return item, None, None, []
+    
+    if not entries:
+        # VLC hasn't taken it, so it's added the usual way as well
+        logger.warning('Cannot enqueue the next item in VLC: its playlist is empty.')
+        return item, None, None, []
+    
+    entry = max(entries, key=lambda e: int(e['id']))
+    loop = asyncio.get_event_loop()
+    length = None
+    
+    if durations:
+        length = await loop.run_in_executor(None, durations.get, item.path)
+    
+    if length is None and entry.get('duration', -1) > 0:
+        length = entry['duration']
+        
+        if durations:
+            await loop.run_in_executor(None, durations.set, item.path, length)
+    
+    return item, entry['id'], length, [e['id'] for e in entries if e is not entry]
+
+
+async def retry(log, request, *args):
+    # VLC exiting is noticed by its launcher, anything else is worth another try
+    delay = VLC_RETRY_DELAY
+    
     while True:
-        schedule.run_pending()
-        await asyncio.sleep(1)
+        try:
+            return await request(*args)
+        except vlc.VLCError as e:
+            log.warning('VLC request %s failed, retrying in %g seconds: %s' % (
+                request.__name__, delay, e
+            ))
+        
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, VLC_MAX_RETRY_DELAY)
+
+
+async def delete_from_vlc(player, uids):
+    for uid in uids:
+        try:
+            await player.delete(uid)
+        except vlc.VLCError as e:
+            logger.warning('Cannot remove item %s from VLC’s playlist: %s' % (uid, e))
 
 
-async def player_coro(player, rebuild_events_queue, extra_items_queue, ping_urls=None):
+async def player_coro(player, rebuild_events_queue, extra_items_queue, pinger=None,
+                      durations=None, gapless=False, clock=None, name='', prefetcher=None,
+                      on_playing=None):
+    # on_playing is called with the item VLC plays, or None once it has stopped
+    log = OutputLogger(logger, {'output': name})
+    first_item = True
     playlist = None
+    upcoming = None
+    clock = clock or PlayoutClock()
+    item_ended = None
+    loop = asyncio.get_event_loop()
     
     while True:
         if not playlist:
             current_item_path = None
-            player.empty()
+            upcoming = None
+            clock.reset()
+            await retry(log, player.empty)
+            
+            if on_playing:
+                on_playing(None)
+            
             playlist = await rebuild_events_queue.get()
         
-        try:
-            try:
-                item = extra_items_queue.get_nowait()
-            except asyncio.QueueEmpty:
-                item = playlist.get_next()
-        except StopIteration:
-            # The playlist is empty, so throw it away
-            playlist = None
-            continue
+        if upcoming:
+            # Already waiting in VLC's playlist
+            item, item_id, known_duration, stale_ids = upcoming
+            upcoming = None
+            
+            if not is_playable(item.location):
+                # Deleted while it was waiting, VLC's older entries go with the next one
+                log.info('%s has been deleted before its turn, skipping it.' % item.path)
+                continue
         else:
-            # VLC hangs horribly when asked to open a non-existing file
-            if not os.path.isfile(item.path):
-                logger.warning((
-                    '%s does not exist anymore, but normally this shouldn’t happen. '
-                    'Stopping until next rebuild.'
-                ) % item.path)
+            try:
+                item = take_next_item(playlist, extra_items_queue)
+            except StopIteration:
+                # The playlist is empty, so throw it away
                 playlist = None
                 continue
             
-            play_duration = item.source.item_play_duration
-            
-            if item.path != current_item_path:
+            item_id, known_duration, stale_ids = None, None, []
+        
+        location = item.location
+        
+        # VLC hangs horribly when asked to open a non-existing file
+        if not is_playable(location):
+            log.warning((
+                '%s does not exist anymore, but normally this shouldn’t happen. '
+                'Stopping until next rebuild.'
+            ) % item.path)
+            playlist = None
+            continue
+        
+        play_duration = item.source.item_play_duration
+        
+        if item.path != current_item_path:
+            if item_id:
+                # Switching to an enqueued item takes a single request
+                try:
+                    await player.play(item_id)
+                except vlc.VLCError as e:
+                    # It may or may not have switched, adding the item again makes sure
+                    log.warning('Cannot switch to the enqueued item in VLC: %s' % e)
+                    item_id = None
+                    await retry(log, player.add, location)
+                
+                asyncio.ensure_future(delete_from_vlc(player, stale_ids))
+            else:
                 # VLC occasionally chokes on playlists and keeps playing what it was playing
                 if item.path.lower().endswith(config.PLAYLIST_EXTENSIONS):
-                    player.empty()
+                    await retry(log, player.empty)
                 
-                player.add(item.path)
-
-            if play_duration < 0:
-                # <0 means play the first abs(play_duration) seconds.
-                # The next time it will start from the start OR if you
-                # change VLC's "Continue?" to "Always" it will start
-                # from where it left off, then repeat at the start,
-                # for a total of .abs(play_duration) seconds.
-                # If the length can't be determined, default to abs(play_duration).
-                await asyncio.sleep(0.25)
-                actual_duration = player.status().get('length', 0)
-                if actual_duration <= 0:
-                    actual_duration = config.IMAGE_PLAY_DURATION
-                play_duration = min(actual_duration, -play_duration)
-
-            if play_duration == 0:
-                # 0 means "play until it done"
+                await retry(log, player.add, location)
+        
+        clock.switched()
+        
+        if item_ended is not None:
+            TRANSITION_SECONDS.observe(clock.now() - item_ended, output=name)
+            item_ended = None
+        
+        if play_duration <= 0:
+            # Ask VLC for the length only if it isn't known from before
+            actual_duration = known_duration
+            
+            if actual_duration is None and durations:
+                actual_duration = await loop.run_in_executor(None, durations.get, item.path)
+            
+            if actual_duration is None:
                 await asyncio.sleep(0.25)
-                play_duration = player.status().get('length', 0)
+                status = await retry(log, player.status)
+                actual_duration = status.get('length', 0)
                 
-                if play_duration <= 0:
-                    play_duration = config.IMAGE_PLAY_DURATION
-
-            if item.path != current_item_path:
-                logger.info('Playing %s for %i seconds.' % (item.path, play_duration))
-                for ping_url in ping_urls:
-                    name = os.path.basename(item.path) 
-                    try:
-                        r = requests.post(ping_url, json={"name":name})
-                    except requests.exceptions.RequestException as e:
-                        logger.error('PING_URL failed={0} url={1}'.format(e, ping_url))
-                    else:
-                        if r.status_code != requests.codes.created:
-                            logger.error('PING_URL status={0} url={1}'.format(r.status_code, ping_url))
-                current_item_path = item.path
-            
-            finished, pending = await asyncio.wait([
-                asyncio.create_task(asyncio.sleep(play_duration)),
-                asyncio.create_task(rebuild_events_queue.get())
-                ],
-                return_when=asyncio.FIRST_COMPLETED)
-            
-            for task in finished:
-                result = task.result()
-                
-                if result:  # we have a new playlist
-                    playlist = result
-                    current_item_path = None
-                    player.empty()
+                # Otherwise it's left to a later play of the item to store its length
+                if durations and is_status_of(status, item_id, location):
+                    await loop.run_in_executor(None, durations.set, item.path, actual_duration)
+            
+            if actual_duration <= 0:
+                actual_duration = config.IMAGE_PLAY_DURATION
+        
+        if play_duration < 0:
+            # <0 means play the first abs(play_duration) seconds.
+            # The next time it will start from the start OR if you
+            # change VLC's "Continue?" to "Always" it will start
+            # from where it left off, then repeat at the start,
+            # for a total of .abs(play_duration) seconds.
+            # If the length can't be determined, default to abs(play_duration).
+            play_duration = min(actual_duration, -play_duration)
+        
+        if play_duration == 0:
+            # 0 means "play until it done"
+            play_duration = actual_duration
+        
+        clock.advance(play_duration)
+        
+        if item.path != current_item_path:
+            log.info('Playing %s for %i seconds.' % (item.path, play_duration))
+            log.debug(
+                'Playout clock: {last_drift:+.3f} s drift, {max_drift:.3f} s max, '
+                '{lead:.3f} s lead.'.format(**clock.get_stats())
+            )
+            
+            ITEMS_PLAYED.inc(output=name)
+            
+            if first_item:
+                log_startup('first_item_playing', log)
+                first_item = False
+            
+            if pinger:
+                pinger.ping(os.path.basename(item.path))
             
-            for task in pending:
-                task.cancel()
+            current_item_path = item.path
+            
+            if on_playing:
+                on_playing(item)
+            
+            if prefetcher:
+                # Warm the next file up while this one plays
+                prefetcher.prefetch(*get_upcoming_paths(playlist, extra_items_queue))
+        
+        if gapless:
+            preparing = asyncio.ensure_future(prepare_next_item(
+                player, playlist, extra_items_queue, current_item_path, durations
+            ))
+        
+        finished, pending = await asyncio.wait([
+            asyncio.create_task(clock.sleep()),
+            asyncio.create_task(rebuild_events_queue.get())
+            ],
+            return_when=asyncio.FIRST_COMPLETED)
+        item_ended = clock.now()
+        
+        for task in pending:
+            task.cancel()
+        
+        for task in finished:
+            result = task.result()
+            
+            if result:  # we have a new playlist
+                playlist = result
+                current_item_path = None
+                clock.reset()
+                await retry(log, player.empty)
+                
+                if on_playing:
+                    on_playing(None)
+        
+        if gapless:
+            if current_item_path is None:
+                preparing.cancel()
+            else:
+                upcoming = await preparing
 
 
-async def main_coro():
-    # Setup VLC
-    launcher = vlc.VLCLauncher(config.VLC, debug=config.DEBUG)
-    await launcher.launch()
-    player = vlc.VLCHTTPClient(config.VLC)
+async def main_coro(wall_time=time.time):
+    outputs_config = get_outputs()
+    
+    # Shared by all outputs
+    durations = DurationCache(resolve_path(config.DURATION_CACHE))
+    scan_cache = ScanCache(resolve_path(config.SCAN_CACHE))
+    shuffle_state = ShuffleState(resolve_path(config.SHUFFLE_STATE))
+    playlist_files = PlaylistFileCache()
+    date_catalog = DateCatalog(config.FILENAME_WITH_A_DATE_PATTERN)
+    timers = TimerScheduler(wall_time=wall_time)
+    mirror = Mirror(
+        any(source.get('mirror') for output in outputs_config for source in output['sources'])
+        and resolve_path(config.MIRROR['path']) or None, config.MIRROR['max_bytes']
+    )
+    prefetcher = config.PREFETCH['enabled'] and Prefetcher(
+        config.PREFETCH['bytes'], config.PREFETCH['rate'], max_pending=4 * len(outputs_config)
+    )
     
     # Setup playlists
     default_playlist_config = {
-        'allowed_extensions': tuple(list(config.MEDIA_EXTENSIONS) + list(config.PLAYLIST_EXTENSIONS)),
-        'filename_with_a_date_pattern': config.FILENAME_WITH_A_DATE_PATTERN
+        'allowed_extensions': get_allowed_extensions(),
+        'date_catalog': date_catalog,
+        'mirror': mirror,
+        'recursive': config.MEDIA_RECURSIVE,
+        'duration_cache': durations,
+        'scan_cache': scan_cache,
+        'shuffle_state': shuffle_state,
+        'playlist_extensions': config.PLAYLIST_EXTENSIONS,
+        'playlist_file_cache': playlist_files,
+        'wall_time': wall_time
     }
-
-    primary_playlist = Playlist(
-        name='PRIMARY', **default_playlist_config, recursive=config.MEDIA_RECURSIVE,
-        ignore_playing_time_if_empty=config.IGNORE_PLAYING_TIME_IF_PLAYLIST_IS_EMPTY
-    )
-    special_playlist = Playlist(
-        name='SPECIAL', **default_playlist_config, recursive=config.MEDIA_RECURSIVE
+    
+    outputs = [
+        Output(
+            output_config['name'], output_config['sources'], default_playlist_config,
+            source_mixing_function=config.SOURCE_MIXING_FUNCTION,
+            ignore_playing_time_if_empty=config.IGNORE_PLAYING_TIME_IF_PLAYLIST_IS_EMPTY,
+            logger=logger
+        ) for output_config in outputs_config
+    ]
+    
+    launchers = [vlc.VLCLauncher(o['vlc'], debug=config.DEBUG) for o in outputs_config]
+    pipeline = RebuildPipeline(
+        outputs, scan_cache=scan_cache, shuffle_state=shuffle_state, **config.REBUILD
     )
-    adverts_playlist = Playlist(
-        name='ADS', **default_playlist_config, recursive=config.MEDIA_RECURSIVE,
-        source_mixing_function='chain'
+    snapshot = Snapshot(
+        outputs, resolve_path(config.SNAPSHOT), config.SNAPSHOT_INTERVAL, key=(
+            version.VERSION, [(o['name'], o['sources']) for o in outputs_config],
+            default_playlist_config['allowed_extensions'],
+            config.FILENAME_WITH_A_DATE_PATTERN, config.MEDIA_RECURSIVE,
+            config.SOURCE_MIXING_FUNCTION, config.IGNORE_PLAYING_TIME_IF_PLAYLIST_IS_EMPTY
+        ), scan_cache=scan_cache, shuffle_state=shuffle_state, playlist_files=playlist_files,
+        wall_time=wall_time
     )
-
-    for source in config.SOURCES:
-        if source.get('play_every_minutes'):
-            adverts_playlist.add_source(source)
-        elif source.get('special'):
-            special_playlist.add_source(source)
-        else:
-            primary_playlist.add_source(source)
-    
-    # Queues
-    rebuild_events_queue = asyncio.Queue()
-    periodic_items_queue = asyncio.Queue()
-    
-    # Rebuild
-    def rebuild():
-        rebuild_events_queue.empty()
-        periodic_items_queue.empty()
-        schedule.clear('ads')
-        
-        primary_playlist.build()
-        special_playlist.build()
-        
-        # Choose current playlist
-        if special_playlist.is_empty():
-            selected_playlist = primary_playlist
-            adverts_playlist.build()
-            
-            if primary_playlist.is_empty():
-                # Only run ads if there's other content
-                if not adverts_playlist.is_empty():
-                    logger.warning('Ads will run only when there is other content.')
+    
+    def schedule_ads(output, delays=None):
+        # delays: seconds until the first run of each ad, when resuming
+        tag = (output.name, 'ads')
+        timers.clear(tag)
+        output.ad_jobs = []
+        
+        if output.primary.is_empty():
+            # Only run ads if there's other content
+            if not output.adverts.is_empty():
+                output.logger.warning('Ads will run only when there is other content.')
+            
+            return
+        
+        ads = list(output.adverts.get_items())
+        output.logger.info('Scheduling %i ad(s).' % len(ads))
+        report.listing('%sAds scheduled:' % (output.name and '[%s] ' % output.name), lambda: [
+            '%s every %i minute(s)' % (item.path, item.source.play_every_minutes) for item in ads
+        ])
+        
+        for item in ads:
+            def enqueue(item=item, queue=output.periodic_items_queue):
+                return queue.put_nowait(item)
+            
+            job = timers.every(
+                item.source.play_every_minutes * 60, enqueue, tag=tag,
+                delay=(delays or {}).get(item.path)
+            )
+            output.ad_jobs.append((item.path, job))
+    
+    # Hand the freshly built playlists over to the players
+    def on_rebuild(selected_playlists, ad_delays=None):
+        for i, (output, selected_playlist) in enumerate(zip(outputs, selected_playlists)):
+            drain_queue(output.rebuild_events_queue)
+            drain_queue(output.periodic_items_queue)
+            
+            if selected_playlist is output.special:
+                output.logger.info(
+                    'Playing %s playlist instead of everything else.' % output.special.name
+                )
+                timers.clear((output.name, 'ads'))
             else:
-                for item in adverts_playlist.get_items():
-                    logger.info((
-                        'Scheduling {0.path} to run every {0.source.play_every_minutes} minute(s).'
-                    ).format(item))
-                    
-                    def enqueue(item=item):
-                        return periodic_items_queue.put_nowait(item)
-                    
-                    schedule.every(item.source.play_every_minutes).minutes.do(enqueue).tag('ads')
-        else:
-            logger.info('Playing %s playlist instead of everything else.' % special_playlist.name)
-            selected_playlist = special_playlist
+                schedule_ads(output, ad_delays[i] if ad_delays else None)
+            
+            output.selected = selected_playlist
+            output.rebuild_events_queue.put_nowait(selected_playlist)
+        
+        mirror.sync(pipeline.get_playlists())
+        
+        for output, clock in zip(outputs, clocks):
+            if clock.transitions:
+                output.logger.info((
+                    'Playout clock: {transitions} transition(s), mean drift {mean_drift:.3f} s, '
+                    'max drift {max_drift:.3f} s, {slip:.1f} s lost to stalls.'
+                ).format(**clock.get_stats()))
+    
+    # Patch the playlists with the changes reported by the watchers
+    async def update(changes):
+        if changes is None:
+            # The watcher doesn't know what exactly has changed
+            return pipeline.trigger()
+        
+        if any(path.lower().endswith(config.PLAYLIST_EXTENSIONS) for change, path in changes):
+            # Playlist files are only expanded by a build
+            return pipeline.trigger()
+        
+        for change, path in changes:
+            if change == DELETED:
+                mirror.discard(path)
+        
+        # Not the current items of the playlists: in gapless mode those are
+        # already the next ones, waiting in VLC's playlist
+        current_items = [output.playing for output in outputs]
+        results = await pipeline.update(changes)
+        mirror.sync(pipeline.get_playlists())
+        
+        if any(reselect for updated, reselect in results):
+            # Another playlist has to be selected (or the current one has run out)
+            return pipeline.trigger()
+        
+        for output, current_item, (updated, reselect) in zip(outputs, current_items, results):
+            if output.selected is output.primary and updated[2]:
+                schedule_ads(output)
+            
+            if current_item and (DELETED, current_item.path) in changes:
+                # Restart VLC from the current position of the playlist
+                output.rebuild_events_queue.put_nowait(output.selected)
+    
+    def log_upcoming():
+        upcoming = date_catalog.get_upcoming(datetime.date.fromtimestamp(wall_time()))
+        
+        if upcoming:
+            logger.info('Files dated for the next days: %s.' % ', '.join(
+                '%s: %i' % (day.isoformat(), count) for day, count in upcoming
+            ))
+    
+    # At midnight, swap the dated files of the previous day for those of the new one
+    async def rollover():
+        changes = date_catalog.rollover(datetime.date.fromtimestamp(wall_time()))
+        
+        if changes is None:
+            # The playlists have been resumed, not built, so nothing is indexed yet
+            return pipeline.trigger()
+        
+        removed, added = changes
+        logger.info('New day: %i file(s) dated yesterday removed, %i dated today added.' % (
+            len(removed), len(added)
+        ))
+        log_upcoming()
+        
+        if removed or added:
+            await update(
+                {(DELETED, path) for path in removed} | {(ADDED, path) for path in added}
+            )
+    
+    async def build():
+        # Resume from the snapshot if the sources haven't changed since it was saved
+        resumed = await asyncio.get_event_loop().run_in_executor(None, snapshot.load)
+        selected_playlists = resumed and await pipeline.restore(resumed['outputs'])
+        
+        if selected_playlists:
+            log_startup('playlists_resumed')
+            return selected_playlists, resumed
         
-        rebuild_events_queue.put_nowait(selected_playlist)
+        selected_playlists = await pipeline.rebuild()
+        log_startup('playlists_built')
+        return selected_playlists, None
     
-    rebuild()
+    async def launch():
+        # One VLC instance per output
+        await asyncio.gather(*[launcher.launch() for launcher in launchers])
+        log_startup('vlc_ready')
+    
+    clocks = [PlayoutClock() for output in outputs]
+    
+    # The playlists are built while VLC is starting
+    (selected_playlists, resumed), launched = await asyncio.gather(build(), launch())
+    
+    if resumed:
+        # Ads that were due while the scheduler was stopped run first
+        elapsed = max(wall_time() - resumed['time'], 0)
+        on_rebuild(selected_playlists, [
+            {path: max(delay - elapsed, 0) for path, delay in state['ads'].items()}
+            for state in resumed['outputs']
+        ])
+        
+        for output, state in zip(outputs, resumed['outputs']):
+            output.resume_periodic_items(state)
+    else:
+        on_rebuild(selected_playlists)
+        log_upcoming()
+    
+    timers.daily_at(datetime.time(0, 0), lambda: asyncio.ensure_future(rollover()), tag='rollover')
+    
+    if mirror.root:
+        # Also catches the files that have been modified in place
+        timers.every(
+            config.MIRROR['interval'], lambda: mirror.sync(pipeline.get_playlists()), tag='mirror'
+        )
     
     # Setup the rebuild schedule
-    rebuild_schedule = ['00:00']
-    for playlist in (primary_playlist, special_playlist, adverts_playlist):
-        times = playlist.get_rebuild_schedule()
-        for time in times:
-            time_str = time.strftime('%H:%M')  # schedule doesn't support time objects
-            if time_str not in rebuild_schedule:
-                rebuild_schedule.append(time_str)
+    rebuild_schedule = set()
+    for playlist in pipeline.get_playlists():
+        rebuild_schedule.update(playlist.get_rebuild_schedule())
     
-    for time_str in rebuild_schedule:
-        schedule.every().day.at(time_str).do(rebuild)
+    for rebuild_time in rebuild_schedule:
+        timers.daily_at(rebuild_time, pipeline.trigger, tag='rebuild')
     
-    logger.info('Rebuilds will run at: %s.' % ', '.join(sorted(rebuild_schedule)))
+    if rebuild_schedule:
+        logger.info('Rebuilds will run at: %s.' % ', '.join(
+            t.strftime('%H:%M:%S' if t.second else '%H:%M') for t in sorted(rebuild_schedule)
+        ))
     
     # Setup coroutines
     tasks = [
-        launcher.watch_exit(), schedule_coro(),
-        player_coro(player, rebuild_events_queue, periodic_items_queue, config.PING_URLS)
+        pipeline.run(on_rebuild), snapshot.run(),
+        metrics.run(
+            config.METRICS['enabled'], config.METRICS['host'], config.METRICS['port'],
+            resolve_path(config.METRICS['dump']), config.METRICS['dump_interval']
+        )
     ]
     
-    for source in config.SOURCES:
-        tasks.append(watchgod_coro(source['path'], action=rebuild))
+    for output, output_config, launcher, clock in zip(outputs, outputs_config, launchers, clocks):
+        player = vlc.VLCHTTPClient(output_config['vlc'])
+        pinger = PingDispatcher(output_config['ping_urls'], **config.PING)
+        tasks += [
+            launcher.watch_exit(), pinger.run(),
+            player_coro(
+                player, output.rebuild_events_queue, output.periodic_items_queue, pinger,
+                durations, gapless=config.GAPLESS_PLAYBACK, clock=clock, name=output.name,
+                prefetcher=prefetcher, on_playing=output.set_playing
+            )
+        ]
+    
+    # One watcher for the sources of all outputs
+    tasks.append(watch_coro(
+        sorted(set().union(*[output.get_watched_paths() for output in outputs])),
+        action=update
+    ))
     
     await asyncio.gather(*tasks)
 
@@ -212,7 +618,13 @@ async def main_coro():
 @click.command()
 @click.version_option(version.VERSION)
 def main():
+    load_config()
     logger.info('VLC Scheduler v%s started.' % version.VERSION)
+    report_listener = report.start(
+        resolve_path(config.BUILD_REPORT['path']), config.BUILD_REPORT['max_bytes'],
+        config.BUILD_REPORT['backup_count']
+    )
+    log_startup('config_loaded')
     
     if sys.platform == 'win32':
         loop = asyncio.ProactorEventLoop()
@@ -229,6 +641,7 @@ def main():
             logger.fatal(str(e))
     finally:
         loop.close()
+        report.stop(report_listener)
         logger.info('VLC Scheduler stopped.')
 
 
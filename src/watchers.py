@@ -1,10 +1,263 @@
-from watchgod import DefaultDirWatcher
+import os, sys, struct, asyncio, ctypes, ctypes.util, logging
 
-from config import config
+from playlist import ADDED, MODIFIED, DELETED
 
+# inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
 
-class VLCSchedulerSourceWatcher(DefaultDirWatcher):
-    allowed_extensions = tuple(list(config.MEDIA_EXTENSIONS) + list(config.PLAYLIST_EXTENSIONS))
+INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+def load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    except OSError:
+        return None
+    
+    if not hasattr(libc, 'inotify_init1'):
+        return None
+    
+    return libc
+
+
+class InotifyWatcher:
+    """Watches any number of source directories with a single inotify instance.
+    
+    ``paths`` is a list of (path, recursive) pairs. ``changes`` yields sets
+    of (change, path) pairs like watchgod's awatch, collected for ``debounce``
+    milliseconds after the first event, or None when the kernel has dropped
+    events and the sources have to be scanned again.
+    """
+    
+    def __init__(self, paths, allowed_extensions, debounce=3600, libc=None):
+        self.libc = libc or load_libc()
+        
+        if self.libc is None:
+            raise OSError('inotify is not available on this system.')
+        
+        self.paths = paths
+        self.allowed_extensions = tuple(allowed_extensions)
+        self.debounce = debounce
+        self._fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1() failed.')
+        
+        self._watches = {}
+        self._files = {}
+        self._pending = {}
+        self._overflow = False
+        self._event = asyncio.Event()
+    
+    def _add_watch(self, path, recursive):
+        wd = self.libc.inotify_add_watch(self._fd, os.fsencode(path), INOTIFY_MASK)
+        
+        if wd < 0:
+            # Most likely fs.inotify.max_user_watches is too low
+            logging.warning('Cannot watch %s: %s' % (path, os.strerror(ctypes.get_errno())))
+        elif wd in self._watches:
+            # Overlapping sources share the watch, the directory stays recursive
+            # if any of them wants it to be
+            watched_path, watched_recursive = self._watches[wd]
+            self._watches[wd] = (watched_path, watched_recursive or recursive)
+        else:
+            self._watches[wd] = (path, recursive)
+    
+    def _add_tree(self, path, recursive, report=False):
+        self._add_watch(path, recursive)
+        names = set()
+        
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            return
+        
+        for entry in entries:
+            if entry.is_dir():
+                if recursive:
+                    self._add_tree(entry.path, recursive, report)
+            elif entry.name.lower().endswith(self.allowed_extensions) and entry.is_file():
+                names.add(entry.name)
+                
+                if report:  # files that were there before the watch was set up
+                    self._record(ADDED, entry.path)
+        
+        self._files[path] = names
+    
+    def _remove_tree(self, path):
+        prefix = path + os.sep
+        
+        for directory in [d for d in self._files if d == path or d.startswith(prefix)]:
+            for name in self._files.pop(directory):
+                self._record(DELETED, os.path.join(directory, name))
+        
+        for wd, (watched_path, recursive) in list(self._watches.items()):
+            if watched_path == path or watched_path.startswith(prefix):
+                self.libc.inotify_rm_watch(self._fd, wd)
+                del self._watches[wd]
+    
+    def _record(self, change, path):
+        previous = self._pending.get(path)
+        
+        if previous == ADDED and change == DELETED:
+            del self._pending[path]
+        elif previous == ADDED:
+            pass
+        elif previous == DELETED and change == ADDED:
+            self._pending[path] = MODIFIED
+        else:
+            self._pending[path] = change
+    
+    def _handle(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            self._overflow = True
+            return
+        
+        if wd not in self._watches:
+            return
+        
+        if mask & IN_IGNORED:
+            del self._watches[wd]
+            return
+        
+        directory, recursive = self._watches[wd]
+        
+        if not name:
+            return
+        
+        path = os.path.join(directory, name)
+        
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO) and recursive:
+                self._add_tree(path, recursive, report=True)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self._remove_tree(path)
+            
+            return
+        
+        if not name.lower().endswith(self.allowed_extensions):
+            return
+        
+        files = self._files.setdefault(directory, set())
+        
+        if mask & (IN_CREATE | IN_MOVED_TO):
+            files.add(name)
+            self._record(ADDED, path)
+        elif mask & (IN_DELETE | IN_MOVED_FROM):
+            files.discard(name)
+            self._record(DELETED, path)
+        elif mask & IN_CLOSE_WRITE:
+            if name in files:
+                self._record(MODIFIED, path)
+            else:
+                files.add(name)
+                self._record(ADDED, path)
+    
+    def _read(self):
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return
+        
+        offset = 0
+        
+        while offset + INOTIFY_EVENT.size <= len(data):
+            wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            self._handle(wd, mask, name)
+        
+        if self._pending or self._overflow:
+            self._event.set()
+    
+    def _add_sources(self):
+        for path, recursive in self.paths:
+            self._add_tree(os.path.normpath(path), recursive)
+    
+    async def changes(self):
+        loop = asyncio.get_event_loop()
+        
+        # Events that happen during the initial walk wait in the kernel's queue
+        await loop.run_in_executor(None, self._add_sources)
+        loop.add_reader(self._fd, self._read)
+        
+        try:
+            while True:
+                await self._event.wait()
+                await asyncio.sleep(self.debounce / 1000)
+                self._event.clear()
+                
+                if self._overflow:
+                    logging.warning('Too many changes in the sources, some have been missed.')
+                    self._overflow = False
+                    self._pending = {}
+                    yield None
+                elif self._pending:
+                    pending, self._pending = self._pending, {}
+                    yield {(change, path) for path, change in pending.items()}
+        finally:
+            loop.remove_reader(self._fd)
+            os.close(self._fd)
+
+
+async def poll_changes(paths, allowed_extensions, debounce=3600):
+    # Fallback for systems without inotify: one watchgod poller per path
+    from watchgod import DefaultDirWatcher, awatch
+    
+    class SourceWatcher(DefaultDirWatcher):
+        def should_watch_file(self, entry):
+            return entry.name.lower().endswith(tuple(allowed_extensions))
+    
+    queue = asyncio.Queue()
+    
+    async def poll(path):
+        async for changes in awatch(path, watcher_cls=SourceWatcher, debounce=debounce):
+            await queue.put(changes)
+    
+    tasks = [asyncio.ensure_future(poll(path)) for path in sorted(set(p for p, r in paths))]
+    
+    try:
+        while True:
+            yield await queue.get()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def watch_sources(paths, allowed_extensions, debounce=3600, backend='auto'):
+    if backend not in ('auto', 'inotify', 'polling'):
+        raise ValueError('Unsupported watcher <backend>: %s' % backend)
+    
+    changes = None
+    
+    if backend != 'polling' and load_libc():
+        try:
+            changes = InotifyWatcher(paths, allowed_extensions, debounce).changes()
+        except OSError as e:
+            # e.g. fs.inotify.max_user_instances has been reached
+            logging.warning('Cannot use inotify, polling the sources instead: %s' % e)
+        else:
+            logging.debug('Watching the sources with inotify.')
+    elif backend == 'inotify':
+        logging.warning('inotify is not available, polling the sources instead.')
+    
+    if changes is None:
+        changes = poll_changes(paths, allowed_extensions, debounce)
     
-    def should_watch_file(self, entry):
-        return entry.name.lower().endswith(self.allowed_extensions)
+    async for change_set in changes:
+        # ./sub/x.mp4 -> sub/x.mp4, the same form as the paths of the sources
+        yield change_set and {(change, os.path.normpath(path)) for change, path in change_set}
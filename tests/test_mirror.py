@@ -0,0 +1,135 @@
+import os, sys, time, shutil, tempfile, threading, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from mirror import Mirror
+from playlist import Playlist
+
+
+class SlowShare:
+    """Stands in for a share that doesn't answer until it's released."""
+    
+    def __init__(self):
+        self.opened = threading.Event()
+        self.released = threading.Event()
+    
+    def open(self, path, mode):
+        self.opened.set()
+        self.released.wait(5)
+        return open(path, mode)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out')
+        
+        time.sleep(0.01)
+
+
+class MirrorTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.source = os.path.join(self.root, 'share')
+        os.makedirs(self.source)
+        
+        for name in ('a.mp4', 'b.mp4'):
+            with open(os.path.join(self.source, name), 'wb') as f:
+                f.write(name.encode() * 100)
+    
+    def make_playlist(self, mirror):
+        playlist = Playlist(allowed_extensions=('.mp4',), mirror=mirror)
+        playlist.add_source({'path': self.source, 'mirror': True})
+        playlist.build()
+        return playlist
+    
+    def test_items_keep_their_path(self):
+        mirror = Mirror(os.path.join(self.root, 'mirror'))
+        playlist = self.make_playlist(mirror)
+        mirror._sync([playlist])
+        
+        for item in playlist.get_items():
+            self.assertEqual(os.path.dirname(item.path), self.source)
+            self.assertEqual(item.location, mirror.get_local_path(item.path))
+        
+        item = playlist.get_next()
+        self.assertEqual(os.path.dirname(item.path), self.source)
+        self.assertNotEqual(item.location, item.path)
+        
+        # Without a valid copy the original is played
+        with open(item.location, 'ab') as f:
+            f.write(b'more')
+        
+        self.assertEqual(item.location, item.path)
+    
+    def test_slow_share(self):
+        share = SlowShare()
+        mirror = Mirror(os.path.join(self.root, 'mirror'), opener=share.open)
+        self.addCleanup(mirror.stop)
+        self.addCleanup(share.released.set)
+        playlist = self.make_playlist(mirror)
+        
+        # Neither the mirror nor its thread keep the caller waiting
+        started = time.monotonic()
+        mirror.sync([playlist])
+        self.assertTrue(share.opened.wait(5))
+        self.assertLess(time.monotonic() - started, 1)
+        
+        item = playlist.get_next()
+        self.assertEqual(item.location, item.path)
+        
+        share.released.set()
+        wait_for(lambda: item.location != item.path)
+    
+    def test_only_own_files_are_cleaned_up(self):
+        root = os.path.join(self.root, 'mirror')
+        mirror = Mirror(root)
+        playlist = self.make_playlist(mirror)
+        mirror._sync([playlist])
+        mirror.save()
+        
+        own = os.path.dirname(mirror.get_local_path(os.path.join(self.source, 'a.mp4')))
+        leftovers = [os.path.join(own, 'c.mp4'), os.path.join(own, 'a.mp4.part')]
+        unrelated = [
+            os.path.join(root, 'notes.txt'), os.path.join(root, 'videos', 'c.mp4'),
+            os.path.join(root, '0123456789abcdeg', 'c.mp4'),
+        ]
+        
+        for path in leftovers + unrelated:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'w').close()
+        
+        # Nothing is touched until the mirror's thread starts
+        mirror = Mirror(root)
+        self.assertTrue(all(os.path.exists(path) for path in leftovers))
+        
+        mirror._load()
+        self.assertFalse(any(os.path.exists(path) for path in leftovers))
+        self.assertTrue(all(os.path.exists(path) for path in unrelated))
+        self.assertEqual(len(os.listdir(own)), 2)
+        
+        for item in playlist.get_items():
+            self.assertEqual(mirror.lookup(item.path), mirror.get_local_path(item.path))
+    
+    def test_share_is_down(self):
+        mirror = Mirror(os.path.join(self.root, 'mirror'))
+        playlist = self.make_playlist(mirror)
+        mirror._sync([playlist])
+        
+        # The playlist is rebuilt from the copies
+        shutil.rmtree(self.source)
+        
+        with self.assertLogs(level='WARNING'):
+            playlist.build()
+        
+        self.assertEqual(
+            [item.location for item in playlist.get_items()],
+            [mirror.get_local_path(os.path.join(self.source, n)) for n in ('a.mp4', 'b.mp4')]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
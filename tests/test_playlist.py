@@ -0,0 +1,123 @@
+import os, sys, shutil, tempfile, unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from durations import DurationCache
+from playlist import Playlist, ADDED, DELETED
+
+
+def touch(*parts):
+    path = os.path.join(*parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'w').close()
+    return path
+
+
+class ApplyChangesTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+    
+    def get_names(self, playlist):
+        return sorted(os.path.relpath(item.path, self.root) for item in playlist.get_items())
+    
+    def test_overlapping_sources(self):
+        # sub/ is a source of its own and a part of the recursive source
+        for name in ('a0.mp4', 'sub/s0.mp4', 'sub/s1.mp4'):
+            touch(self.root, name)
+        
+        playlist = Playlist(allowed_extensions=('.mp4',), source_mixing_function='chain')
+        playlist.add_source(
+            {'path': self.root, 'recursive': True}, {'path': os.path.join(self.root, 'sub')}
+        )
+        playlist.build()
+        
+        deleted = os.path.join(self.root, 'sub', 's1.mp4')
+        os.remove(deleted)
+        playlist.apply_changes({(DELETED, deleted)})
+        self.assertEqual(self.get_names(playlist), ['a0.mp4', 'sub/s0.mp4', 'sub/s0.mp4'])
+        
+        playlist.apply_changes({(ADDED, touch(self.root, 'sub', 's2.mp4'))})
+        self.assertEqual(self.get_names(playlist), [
+            'a0.mp4', 'sub/s0.mp4', 'sub/s0.mp4', 'sub/s2.mp4', 'sub/s2.mp4'
+        ])
+    
+    def test_many_changes(self):
+        # The contents are bisected in place of scanning them, even when a
+        # playlist file puts them out of order
+        names = ['f%02d.mp4' % i for i in range(40)]
+        
+        for name in names:
+            touch(self.root, name)
+        
+        with open(os.path.join(self.root, 'a.m3u'), 'w') as f:
+            f.write('f30.mp4\nf05.mp4\n')
+        
+        for shuffle in (False, True):
+            with self.subTest(shuffle=shuffle):
+                playlist = Playlist(
+                    allowed_extensions=('.mp4', '.m3u'), playlist_extensions=('.m3u',)
+                )
+                playlist.add_source({'path': self.root, 'shuffle': shuffle})
+                playlist.build()
+                
+                for i in range(10):
+                    playlist.get_next()
+                
+                expected = sorted(names + ['f30.mp4', 'f05.mp4'])
+                
+                for name in ('f30.mp4', 'f05.mp4', 'f10.mp4', 'f39.mp4'):
+                    self.assertTrue(playlist.apply_changes({
+                        (DELETED, os.path.join(self.root, name))
+                    }))
+                    expected.remove(name)
+                
+                self.assertFalse(playlist.apply_changes({
+                    (DELETED, os.path.join(self.root, 'f40.mp4'))
+                }))
+                self.assertTrue(playlist.apply_changes({
+                    (ADDED, os.path.join(self.root, 'f40.mp4')),
+                    (ADDED, os.path.join(self.root, 'f10.mp4'))
+                }))
+                self.assertEqual(self.get_names(playlist), sorted(
+                    expected + ['f40.mp4', 'f10.mp4']
+                ))
+    
+    def test_relative_paths(self):
+        touch(self.root, 'sub', 's0.mp4')
+        cwd = os.getcwd()
+        os.chdir(self.root)
+        self.addCleanup(os.chdir, cwd)
+        
+        playlist = Playlist(allowed_extensions=('.mp4',))
+        playlist.add_source({'path': './sub'})
+        playlist.build()
+        
+        touch(self.root, 'sub', 's1.mp4')
+        self.assertTrue(playlist.apply_changes({(ADDED, './sub/s1.mp4')}))
+        self.assertEqual(self.get_names(playlist), ['sub/s0.mp4', 'sub/s1.mp4'])
+
+
+
+class DurationTest(unittest.TestCase):
+    def test_known_duration(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        paths = [touch(root, 'f%i.mp4' % i) for i in range(3)]
+        cache = DurationCache()
+        self.addCleanup(cache.close)
+        cache.set(paths[0], 100)
+        cache.set(paths[1], 20)
+        
+        playlist = Playlist(allowed_extensions=('.mp4',), duration_cache=cache)
+        playlist.add_source({'path': root, 'item_play_duration': -60})
+        playlist.build()
+        
+        # Looked up in bulk, without statting every file again
+        with mock.patch('durations.os.stat', side_effect=AssertionError):
+            self.assertEqual(playlist.get_duration(), (60 + 20, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
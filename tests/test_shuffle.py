@@ -0,0 +1,154 @@
+import os, sys, time, shutil, tempfile, unittest
+
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import playlist as playlist_module
+
+from playlist import Playlist, ADDED
+from shuffle import ShuffleState
+
+
+def make_files(root, name, count):
+    path = os.path.join(root, name)
+    os.makedirs(path)
+    
+    for i in range(count):
+        open(os.path.join(path, '%s%02i.mp4' % (name, i)), 'w').close()
+    
+    return path
+
+
+class ShuffleCycleTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+    
+    def make_playlist(self, lengths, mixing='zip_equally', shuffle_state=None):
+        self.base = tempfile.mkdtemp(dir=self.root)
+        
+        for name, count in lengths:
+            make_files(self.base, name, count)
+        
+        return self.load_playlist([name for name, count in lengths], mixing, shuffle_state)
+    
+    def load_playlist(self, names, mixing='zip_equally', shuffle_state=None):
+        playlist = Playlist(
+            allowed_extensions=('.mp4',), source_mixing_function=mixing,
+            shuffle_state=shuffle_state
+        )
+        
+        for name in names:
+            playlist.add_source({
+                'path': os.path.join(self.base, name), 'shuffle': name == 'shuffled'
+            })
+        
+        playlist.build()
+        return playlist
+    
+    def get_shuffled(self):
+        return set(os.listdir(os.path.join(self.base, 'shuffled')))
+    
+    def play_shuffled(self, playlist, count):
+        # The names of the first count files of the shuffled source that play
+        played = []
+        
+        while len(played) < count:
+            item = playlist.get_next()
+            
+            if item.source.shuffle:
+                played.append(os.path.basename(item.path))
+        
+        return played
+    
+    def assertCycles(self, played, length):
+        for start in range(0, len(played) - length + 1, length):
+            cycle = played[start:start + length]
+            self.assertEqual(len(set(cycle)), length, 'repeated within a cycle: %r' % cycle)
+    
+    def test_no_repeats_with_unequal_lengths(self):
+        for mixing in ('zip_equally', 'proportional', 'chain'):
+            with self.subTest(mixing=mixing):
+                playlist = self.make_playlist([('plain', 5), ('shuffled', 3)], mixing)
+                self.assertCycles(self.play_shuffled(playlist, 30), 3)
+    
+    def test_no_repeats_after_rebuild(self):
+        playlist = self.make_playlist([('plain', 7), ('shuffled', 4)])
+        played = self.play_shuffled(playlist, 2)
+        playlist.build()
+        played += self.play_shuffled(playlist, 22)
+        self.assertCycles(played, 4)
+        
+        # Files are added and removed while the source isn't watched
+        played = self.play_shuffled(playlist, 2)
+        
+        for name in ('shuffled20.mp4', 'shuffled21.mp4', 'shuffled22.mp4'):
+            open(os.path.join(self.base, 'shuffled', name), 'w').close()
+        
+        unplayed = [name for name in sorted(self.get_shuffled()) if name not in played]
+        os.remove(os.path.join(self.base, 'shuffled', unplayed[0]))
+        playlist.build()
+        
+        # The rest of the cycle is every file that hasn't been played in it, once
+        rest = self.play_shuffled(playlist, len(self.get_shuffled()) - len(played))
+        self.assertEqual(sorted(rest), sorted(self.get_shuffled() - set(played)))
+        self.assertCycles(self.play_shuffled(playlist, 30), 6)
+    
+    def test_no_repeats_after_restart(self):
+        path = os.path.join(self.root, 'shuffle.json')
+        playlist = self.make_playlist(
+            [('plain', 3), ('shuffled', 30)], shuffle_state=ShuffleState(path, 0)
+        )
+        played = self.play_shuffled(playlist, 12)
+        
+        for i in range(30, 38):
+            open(os.path.join(self.base, 'shuffled', 'shuffled%02i.mp4' % i), 'w').close()
+        
+        playlist = self.load_playlist(['plain', 'shuffled'], shuffle_state=ShuffleState(path))
+        rest = self.play_shuffled(playlist, 26)
+        self.assertEqual(sorted(played + rest), sorted(self.get_shuffled()))
+    
+    def test_prepared_cycles(self):
+        # The order of the next cycle is sorted in the background
+        with mock.patch.object(playlist_module, 'PREPARED_CYCLE_SIZE', 1):
+            playlist = self.make_playlist([('plain', 2), ('shuffled', 5)])
+            played = []
+            
+            for cycle in range(4):
+                deadline = time.monotonic() + 5
+                
+                while not playlist._next_cycles and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                
+                self.assertTrue(playlist._next_cycles)
+                
+                if cycle == 2:
+                    # Added after the order has been prepared
+                    path = os.path.join(self.base, 'shuffled', 'shuffled99.mp4')
+                    open(path, 'w').close()
+                    playlist.apply_changes({(ADDED, path)})
+                
+                played += self.play_shuffled(playlist, len(self.get_shuffled()))
+        
+        self.assertCycles(played[:10], 5)
+        self.assertCycles(played[10:], 6)
+        self.assertIn('shuffled99.mp4', played[10:16])
+    
+    def test_add_in_the_middle_of_a_cycle(self):
+        playlist = self.make_playlist([('plain', 5), ('shuffled', 4)])
+        played = self.play_shuffled(playlist, 2)
+        
+        path = os.path.join(self.base, 'shuffled', 'shuffled99.mp4')
+        open(path, 'w').close()
+        playlist.apply_changes({(ADDED, path)})
+        
+        # The rest of this cycle has the new file and none of the played ones
+        rest = self.play_shuffled(playlist, 3)
+        self.assertIn('shuffled99.mp4', rest)
+        self.assertCycles(played + rest, 5)
+        self.assertCycles(self.play_shuffled(playlist, 25), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
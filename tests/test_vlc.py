@@ -0,0 +1,133 @@
+import os, sys, asyncio, unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+import httpclient, vlc
+from fakevlc import FakeVLC
+
+
+class MalformedVLC(FakeVLC):
+    # Answers with whatever it's told to
+    body = 'not json'
+    
+    def respond(self, path, command, params):
+        return 'application/json', self.body
+
+
+class FakeVLCTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(asyncio.set_event_loop, None)
+        self.addCleanup(self.loop.close)
+        self.addCleanup(self.cancel_pending)
+    
+    def cancel_pending(self):
+        # Stalled responses are still sleeping
+        pending = asyncio.all_tasks(self.loop)
+        
+        for task in pending:
+            task.cancel()
+        
+        self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+    
+    def run_coro(self, coro):
+        return self.loop.run_until_complete(coro)
+    
+    def start(self, fake):
+        server = self.run_coro(fake.start('127.0.0.1', 0))
+        self.addCleanup(server.close)
+        port = server.sockets[0].getsockname()[1]
+        self.url = 'http://127.0.0.1:%i/' % port
+        return vlc.VLCHTTPClient(
+            {'host': '127.0.0.1', 'port': port, 'password': '', 'timeout': 0.5}
+        )
+
+
+class HTTPClientTest(FakeVLCTestCase):
+    def test_get(self):
+        self.start(FakeVLC())
+        resp = self.run_coro(httpclient.get(self.url, auth=('', 'secret')))
+        self.assertEqual(resp.status, 200)
+        self.assertIn('VideoLAN', resp.text)
+    
+    def test_timeout(self):
+        self.start(FakeVLC(stall_rate=1))
+        
+        with self.assertRaises(httpclient.HTTPTimeoutError):
+            self.run_coro(httpclient.get(self.url, timeout=0.2))
+    
+    def test_error_response(self):
+        self.start(FakeVLC(failure_rate=1))
+        resp = self.run_coro(httpclient.get(self.url))
+        self.assertEqual(resp.status, 500)
+        
+        with self.assertRaises(httpclient.HTTPStatusError):
+            resp.raise_for_status()
+    
+    def test_connection_refused(self):
+        fake = FakeVLC()
+        self.start(fake)
+        self.run_coro(fake.stop())
+        
+        with self.assertRaises(httpclient.HTTPConnectionError):
+            self.run_coro(httpclient.get(self.url))
+    
+    def test_malformed_response(self):
+        async def garbage(reader, writer):
+            await reader.readuntil(b'\r\n\r\n')
+            writer.write(b'garbage\r\n\r\n')
+            writer.close()
+        
+        server = self.run_coro(asyncio.start_server(garbage, '127.0.0.1', 0))
+        self.addCleanup(server.close)
+        url = 'http://127.0.0.1:%i/' % server.sockets[0].getsockname()[1]
+        
+        with self.assertRaises(httpclient.HTTPError):
+            self.run_coro(httpclient.get(url))
+
+
+class VLCHTTPClientTest(FakeVLCTestCase):
+    def test_playback(self):
+        fake = FakeVLC(lengths={'/media/a.mp4': 30}, length_delay=0)
+        player = self.start(fake)
+        
+        self.run_coro(player.add('/media/a.mp4'))
+        self.run_coro(player.enqueue('/media/b=1.mp4'))
+        status = self.run_coro(player.status())
+        entries = list(vlc.iter_playlist_items(self.run_coro(player.playlist())))
+        
+        self.assertEqual(status['length'], 30)
+        self.assertEqual(status['currentplid'], int(entries[0]['id']))
+        self.assertEqual([e['uri'] for e in entries], ['/media/a.mp4', '/media/b=1.mp4'])
+        
+        self.run_coro(player.play(entries[1]['id']))
+        self.assertEqual(self.run_coro(player.status())['currentplid'], int(entries[1]['id']))
+    
+    def test_timeout(self):
+        player = self.start(FakeVLC(stall_rate=1))
+        
+        with self.assertRaises(vlc.VLCConnectionError):
+            self.run_coro(player.status(timeout=0.2))
+    
+    def test_error_response(self):
+        player = self.start(FakeVLC(failure_rate=1))
+        
+        with self.assertRaises(vlc.VLCConnectionError):
+            self.run_coro(player.next())
+    
+    def test_malformed_response(self):
+        fake = MalformedVLC()
+        player = self.start(fake)
+        
+        for body in ('not json', '[1, 2]', ''):
+            fake.body = body
+            
+            with self.subTest(body=body), self.assertRaises(vlc.VLCConnectionError):
+                self.run_coro(player.status())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os, sys, time, shutil, asyncio, tempfile, unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import watchers
+from playlist import ADDED
+from watchers import InotifyWatcher, watch_sources
+
+
+@unittest.skipUnless(watchers.load_libc(), 'inotify is not available')
+class InotifyWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+    
+    def read_changes(self, watcher, timeout=5):
+        deadline = time.monotonic() + timeout
+        
+        while not watcher._pending and time.monotonic() < deadline:
+            watcher._read()
+            time.sleep(0.01)
+        
+        return {(change, path) for path, change in watcher._pending.items()}
+    
+    def test_overlapping_sources(self):
+        # The same directory is a recursive source and a non-recursive one
+        watcher = InotifyWatcher([(self.root, True), (self.root, False)], ('.mp4',))
+        self.addCleanup(os.close, watcher._fd)
+        watcher._add_sources()
+        
+        path = os.path.join(self.root, 'sub', 'a.mp4')
+        os.makedirs(os.path.dirname(path))
+        open(path, 'w').close()
+        
+        self.assertEqual(self.read_changes(watcher), {(ADDED, path)})
+
+
+class WatchSourcesTest(unittest.TestCase):
+    def test_fallback_to_polling(self):
+        async def poll_changes(paths, allowed_extensions, debounce):
+            yield {(ADDED, './a.mp4')}
+        
+        async def first_changes():
+            changes = watch_sources([('.', False)], ('.mp4',))
+            
+            try:
+                return await changes.__anext__()
+            finally:
+                await changes.aclose()
+        
+        error = OSError(24, 'Too many open files')
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        
+        with mock.patch('watchers.load_libc', return_value=object()), \
+                mock.patch('watchers.InotifyWatcher', side_effect=error), \
+                mock.patch('watchers.poll_changes', poll_changes), \
+                self.assertLogs(level='WARNING'):
+            self.assertEqual(loop.run_until_complete(first_changes()), {(ADDED, 'a.mp4')})
+
+
+if __name__ == '__main__':
+    unittest.main()